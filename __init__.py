@@ -6,5 +6,6 @@
 #
 ##############################################################################
 
+from . import controllers
 from . import models
 from . import wizard
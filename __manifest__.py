@@ -24,6 +24,8 @@
         'security/ir.model.access.csv',
         'view/toggl_connector_view.xml',
         'view/res_users.xml',
+        'view/toggl_webhook_view.xml',
+        'view/toggl_sync_run_view.xml',
         'wizard/toggl_entries_wizard_view.xml',
         'data/toggl_cron.xml',
     ],
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+
+from . import main
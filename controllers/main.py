@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+
+import json
+
+from odoo import http
+from odoo.http import request
+
+from ..models.toggl_sync import verify_webhook_signature
+
+import logging
+logger = logging.getLogger(__name__)
+
+class TogglWebhookController(http.Controller):
+
+    @http.route('/toggl/webhook/<int:connector_id>', type='http', auth='public',
+                methods=['POST'], csrf=False)
+    def toggl_webhook(self, connector_id, **kwargs):
+        # Receive a Toggl webhook event and queue it, events are applied by a cron
+        connector = request.env['toggl.connector'].sudo().browse(connector_id).exists()
+        if not connector or not connector.toggl_webhook_secret:
+            return request.make_response('Not Found', status=404)
+
+        body = request.httprequest.get_data()
+        signature = request.httprequest.headers.get('X-Webhook-Signature-256')
+        if not verify_webhook_signature(connector.toggl_webhook_secret, body, signature):
+            logger.warning("Toggl: Rejected webhook event with a bad signature")
+            return request.make_response('Forbidden', status=403)
+
+        try:
+            event = json.loads(body.decode('utf-8'))
+        except ValueError:
+            return request.make_response('Bad Request', status=400)
+
+        # Toggl validates new subscriptions by expecting the code back
+        if event.get('validation_code'):
+            return request.make_response(
+                json.dumps({'validation_code': event['validation_code']}),
+                headers=[('Content-Type', 'application/json')])
+
+        request.env['toggl.webhook.event'].sudo().queue_event(connector, event)
+        return request.make_response('OK')
@@ -10,4 +10,10 @@ from . import res_users
 from . import res_partner
 from . import project
 from . import toggl_connector
+from . import toggl_snapshot
+from . import toggl_sync_job
+from . import toggl_sync_run
+from . import toggl_webhook
+from . import toggl_user
+from . import hr_employee
 from . import hr_timesheet
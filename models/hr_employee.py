@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+
+from odoo import models, api
+
+class HrEmployee(models.Model):
+    _inherit = "hr.employee"
+
+    @api.model
+    def create(self, vals):
+        employee = super(HrEmployee, self).create(vals)
+        if vals.get('user_id'):
+            # Keep the Toggl user mapping in line with the employee's user
+            self.env['toggl.user'].sudo().relink_users(employee.user_id)
+        return employee
+
+    @api.multi
+    def write(self, vals):
+        users = self.mapped('user_id')
+        res = super(HrEmployee, self).write(vals)
+        if 'user_id' in vals:
+            # Both the previous and the new user may change employee
+            self.env['toggl.user'].sudo().relink_users(users | self.mapped('user_id'))
+        return res
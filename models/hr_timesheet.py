@@ -13,3 +13,5 @@ class AccountAnalyticLine(models.Model):
     _inherit = 'account.analytic.line'
 
     toggl_entry_id = fields.Integer("Toggl Time Entry Id", copy=False, index=True)
+    toggl_fingerprint = fields.Char("Toggl Fingerprint", copy=False,
+        help="Hash of the values this line was last imported with from Toggl")
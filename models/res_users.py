@@ -13,3 +13,11 @@ class ResUsers(models.Model):
 
     toggl_username = fields.Char('Toggl Username', help='Toggl Username (Email)')
     toggl_last_fetch = fields.Date('Last date Toggl Timesheets were fetched')
+
+    @api.multi
+    def write(self, vals):
+        res = super(ResUsers, self).write(vals)
+        if 'toggl_username' in vals:
+            # Keep the Toggl user mapping in line with the new username
+            self.env['toggl.user'].sudo().relink_users(self)
+        return res
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+
+import json
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Fastest installed JSON decoder, all of them decode straight from bytes
+# except the standard library's before Python 3.6
+try:
+    from orjson import loads
+except ImportError:
+    try:
+        from ujson import loads
+    except ImportError:
+        if sys.version_info >= (3, 6):
+            from json import loads
+        else:
+            def loads(content):
+                if isinstance(content, bytes):
+                    content = content.decode('utf-8')
+                return json.loads(content)
+
+import logging
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Odoo_TogglAPI'
+API_URL = 'https://www.toggl.com/api/v8'
+REPORTS_URL = 'https://toggl.com/reports/api/v2'
+
+
+class TogglApiError(Exception):
+    """ Raised when a Toggl API call fails """
+
+
+class TokenBucket(object):
+    """ Thread-safe token bucket pacing calls to `rate` per second """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        # Take a token, return the seconds to wait before it may be used
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        # Block until a token is available
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # Drain the bucket so that nobody sends for the next `seconds`
+        with self.lock:
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+            self.updated = time.monotonic()
+
+
+def retry_after(headers):
+    """ Seconds to wait according to the Retry-After header of a response, or None """
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class TogglApi(object):
+    """ HTTP client for the Toggl API
+
+    Owns a pooled requests.Session, so connections to Toggl are kept alive
+    and reused between calls instead of doing a new TLS handshake every time.
+    Calls are paced by a token bucket to the rate Toggl allows, throttled
+    calls are retried after Retry-After and failed idempotent calls are
+    retried with jittered exponential backoff.
+    """
+
+    # Methods that are safe to send again after a server or network error
+    IDEMPOTENT_METHODS = ('get', 'put')
+    RETRY_STATUSES = (500, 502, 503, 504)
+
+    def __init__(self, api_token, pool_size=10, keep_alive=True,
+                 connect_timeout=5.0, read_timeout=60.0,
+                 rate_limit=1.0, max_retries=3, backoff=1.0):
+        self.config = {
+            'api_token': api_token,
+            'pool_size': pool_size,
+            'keep_alive': keep_alive,
+            'connect_timeout': connect_timeout,
+            'read_timeout': read_timeout,
+            'rate_limit': rate_limit,
+            'max_retries': max_retries,
+            'backoff': backoff,
+        }
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.bucket = TokenBucket(rate_limit)
+
+        # Request counters since the last pop_stats(). The client is shared by
+        # every run of the connector in the process, so the counters only feed
+        # the connector's running totals, not the figures of one run.
+        self.stats = {'sent': 0, 'throttled': 0, 'retried': 0}
+        self.stats_lock = threading.Lock()
+
+        # List collecting the request latencies of the run in this thread, see recording()
+        self.local = threading.local()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.auth = (api_token, 'api_token')
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Accept': '*/*',
+            'Accept-Encoding': 'gzip, deflate',
+            'User-Agent': USER_AGENT,
+            'Connection': 'keep-alive' if keep_alive else 'close',
+        })
+
+    def request(self, method, url, params=None, data=None):
+        # Do HTTP request to Toggl API
+        if method not in ['get', 'post', 'put']:
+            raise TogglApiError('Unsupported HTTP method: %s' % (method))
+
+        params = dict(params or {})
+        if method == "get":
+            params.setdefault('user_agent', USER_AGENT)
+            body = None
+        else:
+            data = dict(data or {})
+            data.setdefault('user_agent', USER_AGENT)
+            body = json.dumps(data).encode("utf-8")
+
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            self._count('sent')
+            start = time.time()
+            try:
+                res = self.session.request(method, url, params=params, data=body,
+                                           timeout=self.timeout)
+                self._record_latency(time.time() - start)
+            except requests.exceptions.RequestException as e:
+                wait = self.retry_wait(method, attempt, error=e)
+            else:
+                if res.status_code == requests.codes.ok:
+                    break
+                wait = self.retry_wait(method, attempt, status=res.status_code,
+                                       headers=res.headers, content=res.text)
+
+            attempt += 1
+            self._count('retried')
+            logger.debug("Toggl: Retry %s %s" % (method, url))
+            time.sleep(wait)
+
+        try:
+            return loads(res.content)
+        except ValueError:
+            raise TogglApiError("Decoding JSON response has failed: % s" % res.text)
+
+    def retry_wait(self, method, attempt, status=None, headers=None, content=None, error=None):
+        # Seconds to wait before sending a failed request again, shared by the
+        # blocking and the async client. Raises TogglApiError when the request
+        # must not be resent or is out of retries.
+        wait = None
+        if error is not None:
+            if method not in self.IDEMPOTENT_METHODS or attempt >= self.max_retries:
+                raise TogglApiError("There was an error in your %s request: %s" % (method, error))
+        elif status == 429:
+            # Throttled requests were not processed, so any method can be resent
+            self._count('throttled')
+            if attempt >= self.max_retries:
+                raise TogglApiError("API returned error: %s, %s" % (status, content))
+            wait = retry_after(headers or {})
+            if wait is not None:
+                # The bucket holds back this and every other caller
+                self.bucket.pause(wait)
+                wait = 0.0
+        elif (status not in self.RETRY_STATUSES or method not in self.IDEMPOTENT_METHODS or
+                attempt >= self.max_retries):
+            raise TogglApiError("API returned error: %s, %s" % (status, content))
+
+        if wait is None:
+            wait = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+        return wait
+
+    def _count(self, counter):
+        with self.stats_lock:
+            self.stats[counter] += 1
+
+    def _record_latency(self, seconds):
+        latencies = getattr(self.local, 'latencies', None)
+        if latencies is not None:
+            latencies.append(seconds)
+
+    @contextmanager
+    def recording(self):
+        # Collect the latency (seconds) of every request sent by this thread,
+        # and by functions it hands to other threads through bound(), while
+        # the block runs. Other runs sharing the client are not mixed in.
+        latencies = []
+        previous = getattr(self.local, 'latencies', None)
+        self.local.latencies = latencies
+        try:
+            yield latencies
+        finally:
+            self.local.latencies = previous
+
+    def bound(self, function):
+        # Wrap a function run by a worker thread, so that the requests it
+        # sends are recorded with the calling thread's run
+        latencies = getattr(self.local, 'latencies', None)
+
+        def call(*args, **kwargs):
+            previous = getattr(self.local, 'latencies', None)
+            self.local.latencies = latencies
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.local.latencies = previous
+        return call
+
+    def pop_stats(self):
+        # Return request counters collected since the last call and reset them
+        with self.stats_lock:
+            stats, self.stats = self.stats, dict.fromkeys(self.stats, 0)
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+# One client per connector and process, shared by all threads of the process
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(key, **config):
+    """ Return the pooled client for key, rebuilding it if its config changed """
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None or client.config != config:
+            if client is not None:
+                client.close()
+            logger.debug("Toggl: New API client for %s" % (key,))
+            client = _clients[key] = TogglApi(**config)
+        return client
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+
+import asyncio
+import json
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .toggl_api import API_URL, REPORTS_URL, USER_AGENT, TogglApiError, loads
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def run(coroutine):
+    """ Run a coroutine to completion from synchronous code, e.g. an Odoo cron """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        try:
+            # Cancel what is left, e.g. after an error, and let the tasks
+            # clean up before the loop is closed
+            all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+            pending = [task for task in all_tasks(loop) if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
+
+
+class AsyncTogglApi(object):
+    """ Asyncio client for the Toggl API
+
+    Built on a TogglApi client, whose token, timeouts, retry policy, request
+    counters and rate limiter it shares, so sync and async calls of one
+    connector are paced together. At most max_parallel requests are in
+    flight at once. Uses aiohttp when it is installed, otherwise the
+    blocking client's requests run in the loop's thread pool.
+
+        async with AsyncTogglApi(toggl.toggl_api()) as api:
+            projects = await asyncio.gather(*[api.project(pid) for pid in pids])
+    """
+
+    def __init__(self, sync_api, max_parallel=4, api_url=API_URL, reports_url=REPORTS_URL):
+        self.sync_api = sync_api
+        self.api_url = api_url
+        self.reports_url = reports_url
+        self.max_parallel = max(max_parallel, 1)
+        self.semaphore = None
+        self.session = None
+
+    async def __aenter__(self):
+        self.semaphore = asyncio.Semaphore(self.max_parallel)
+        if aiohttp is not None:
+            config = self.sync_api.config
+            self.session = aiohttp.ClientSession(
+                auth=aiohttp.BasicAuth(config['api_token'], 'api_token'),
+                headers={
+                    'Content-Type': 'application/json',
+                    'Accept': '*/*',
+                    'User-Agent': USER_AGENT,
+                },
+                connector=aiohttp.TCPConnector(limit=config['pool_size']),
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=config['connect_timeout'],
+                    sock_read=config['read_timeout'],
+                ),
+            )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def request(self, method, url, params=None, data=None):
+        async with self.semaphore:
+            if self.session is None:
+                # No aiohttp, run the pooled blocking client in a thread
+                loop = asyncio.get_event_loop()
+                return await loop.run_in_executor(None, self.sync_api.bound(
+                    lambda: self.sync_api.request(method, url, params=params, data=data)))
+            return await self._request(method, url, params, data)
+
+    async def _request(self, method, url, params, data):
+        if method not in ['get', 'post', 'put']:
+            raise TogglApiError('Unsupported HTTP method: %s' % (method))
+
+        params = {key: str(value) for key, value in (params or {}).items()}
+        if method == "get":
+            params.setdefault('user_agent', USER_AGENT)
+            body = None
+        else:
+            data = dict(data or {})
+            data.setdefault('user_agent', USER_AGENT)
+            body = json.dumps(data).encode("utf-8")
+
+        api = self.sync_api
+        attempt = 0
+        while True:
+            await asyncio.sleep(api.bucket.reserve())
+            api._count('sent')
+            start = time.time()
+            try:
+                async with self.session.request(method, url, params=params, data=body) as res:
+                    status = res.status
+                    headers = res.headers
+                    content = await res.read()
+                api._record_latency(time.time() - start)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                wait = api.retry_wait(method, attempt, error=e)
+            else:
+                if status == 200:
+                    break
+                wait = api.retry_wait(method, attempt, status=status,
+                                      headers=headers, content=content)
+
+            attempt += 1
+            api._count('retried')
+            logger.debug("Toggl: Retry %s %s" % (method, url))
+            await asyncio.sleep(wait)
+
+        try:
+            return loads(content)
+        except ValueError:
+            raise TogglApiError("Decoding JSON response has failed: % s" % content)
+
+    """
+    Functions for calling Toggl Api endpoints:
+    """
+    async def me(self):
+        return await self.request('get', '%s/me' % self.api_url)
+
+    async def users(self, wid):
+        return await self.request('get', '%s/workspaces/%s/workspace_users' % (self.api_url, wid))
+
+    async def clients(self, wid):
+        return await self.request('get', '%s/workspaces/%s/clients' % (self.api_url, wid))
+
+    async def projects(self, wid, active):
+        return await self.request('get', '%s/workspaces/%s/projects' % (self.api_url, wid),
+                                  params={'active': active})
+
+    async def project(self, project_id):
+        return await self.request('get', '%s/projects/%s' % (self.api_url, project_id))
+
+    async def project_tasks(self, project_id):
+        return await self.request('get', '%s/projects/%s/tasks' % (self.api_url, project_id))
+
+    async def detailed_report(self, params):
+        return await self.request('get', '%s/details/' % self.reports_url, params=params)
+
+    async def create_client(self, params):
+        response = await self.request('post', '%s/clients' % self.api_url, data={'client': params})
+        return response['data']
+
+    async def update_client(self, client_id, params):
+        response = await self.request('put', '%s/clients/%s' % (self.api_url, client_id),
+                                      data={'client': params})
+        return response['data']
+
+    async def create_project(self, params):
+        response = await self.request('post', '%s/projects' % self.api_url, data={'project': params})
+        return response['data']
+
+    async def update_project(self, project_id, params):
+        response = await self.request('put', '%s/projects/%s' % (self.api_url, project_id),
+                                      data={'project': params})
+        return response['data']
+
+    async def create_task(self, params):
+        response = await self.request('post', '%s/tasks' % self.api_url, data={'task': params})
+        return response['data']
+
+    async def update_task(self, task_id, params):
+        response = await self.request('put', '%s/tasks/%s' % (self.api_url, task_id),
+                                      data={'task': params})
+        return response['data']
+
+    async def update_tasks(self, task_ids, params):
+        ids = ','.join(str(task_id) for task_id in task_ids)
+        response = await self.request('put', '%s/tasks/%s' % (self.api_url, ids),
+                                      data={'task': params})
+        return response['data']
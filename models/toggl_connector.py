@@ -6,17 +6,52 @@
 #
 ##############################################################################
 
-import requests
-import json
-import re
-from base64 import b64encode
+import asyncio
+import math
+import threading
+import time
+from datetime import timedelta
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 from odoo import models, fields, api
 from odoo.exceptions import Warning
+from odoo.tools import split_every
+
+from .toggl_api import API_URL, REPORTS_URL, TogglApiError, get_client
+from .toggl_async import AsyncTogglApi, run as run_async
+from .toggl_sync import (SyncContext, TogglClient, TogglIndex, TogglProject, TogglTask,
+                         TogglTimeEntry, project_records, timesheet_fingerprint, toggl_local_date)
 
 import logging
 logger = logging.getLogger(__name__)
 
+# Maximum number of ids in one Toggl bulk update request
+TOGGL_BULK_SIZE = 100
+
+# Time entries inserted with one INSERT by the backfill
+BACKFILL_BATCH_SIZE = 1000
+
+# Installed modules whose create() of timesheet lines does more than the
+# backfill's raw INSERT fills in (e.g. the sale order line of the task),
+# the backfill creates the lines with create() when one of them is installed
+BACKFILL_CREATE_MODULES = ('sale_timesheet', 'hr_timesheet_sheet', 'timesheet_grid')
+
+# Advisory lock key (with the connector id) of a running connector
+TOGGL_LOCK_KEY = 8675
+
+# Seconds the change cursor of a fetched workspace is set back, so changes
+# are not missed when the Odoo clock is ahead of Toggl's
+TOGGL_SINCE_MARGIN = 300
+
+# Timesheet line fields set from Toggl time entries
+MANY2ONE_TIMESHEET_FIELDS = ['employee_id', 'project_id', 'account_id', 'task_id']
+TIMESHEET_FIELDS = MANY2ONE_TIMESHEET_FIELDS + [
+    'name', 'date', 'unit_amount', 'toggl_entry_id', 'toggl_fingerprint',
+]
+
+
 class TogglConnector(models.Model):
     _name = "toggl.connector"
     _description = "Toggl Connector"
@@ -57,21 +92,110 @@ class TogglConnector(models.Model):
         help="Date of lastest cron run"
     )
 
-    # Default headers for requests
-    headers = {
-        'Authorization': '',
-        'Content-Type': 'application/json',
-        'Accept': '*/*',
-        'User-Agent': 'Odoo_TogglAPI',
-    }
+    toggl_pool_size = fields.Integer('HTTP pool size',
+        help="Maximum number of pooled connections to the Toggl API.",
+        default=10
+    )
+    toggl_keep_alive = fields.Boolean('HTTP keep-alive',
+        help="Reuse connections to the Toggl API between requests.",
+        default=True
+    )
+    toggl_connect_timeout = fields.Float('Connect timeout',
+        help="Seconds to wait for a connection to the Toggl API.",
+        default=5.0
+    )
+    toggl_read_timeout = fields.Float('Read timeout',
+        help="Seconds to wait for a response from the Toggl API.",
+        default=60.0
+    )
+    toggl_rate_limit = fields.Float('Requests per second',
+        help="Maximum rate of requests sent to the Toggl API.",
+        default=1.0
+    )
+    toggl_max_retries = fields.Integer('Max retries',
+        help="""How many times a throttled or failed idempotent
+            request is retried before giving up.""",
+        default=3
+    )
+    toggl_max_parallel = fields.Integer('Max parallel requests',
+        help="""Maximum number of Toggl API requests sent in parallel,
+            e.g. when fetching the tasks of all projects.""",
+        default=4
+    )
+    toggl_report_shard_days = fields.Integer('Report shard (days)',
+        help="""Long time entry imports are split into date ranges of this
+            many days, which are downloaded from Toggl in parallel.""",
+        default=31
+    )
+    last_workspace_import = fields.Date('Latest workspace import',
+        help="Last day imported by the workspace time entry import"
+    )
+    toggl_recheck = fields.Boolean('Re-check recent entries',
+        help="""The scheduled workspace import reads the whole re-check window
+            from Toggl on every run, updating changed entries and removing
+            entries deleted in Toggl. The Toggl Reports API can't list only
+            changed entries, so this downloads more than the plain import,
+            and edits older than the window are not seen."""
+    )
+    toggl_recheck_days = fields.Integer('Re-check window (days)',
+        help="How many days back re-checks look for changed and deleted time entries.",
+        default=60
+    )
+    toggl_snapshot_ttl = fields.Integer('Snapshot lifetime (hours)',
+        help="""How long the cached snapshot of Toggl clients, projects and
+            tasks is used before the workspace is fetched again in full.
+            Only changes are fetched while the snapshot is fresh.
+            0 disables the snapshot.""",
+        default=24
+    )
+    toggl_sync_chunk_size = fields.Integer('Projects per chunk',
+        help="""The scheduled sync commits its progress after every
+            chunk of this many projects.""",
+        default=50
+    )
+    toggl_sync_time_budget = fields.Integer('Sync time budget (seconds)',
+        help="""The scheduled sync stops after this many seconds and
+            continues from its checkpoint on the next run. 0 means no limit.""",
+        default=900
+    )
+    toggl_webhook_secret = fields.Char('Webhook secret',
+        help="""Secret of the Toggl webhook subscription. Toggl events are
+            received at /toggl/webhook/<connector id> when this is set."""
+    )
+    backfill_date_from = fields.Date('Backfill from',
+        help="""First day of the Toggl history to backfill. New entries are
+            inserted in bulk without create(), so overrides of it in other
+            modules do not run, unless a module known to need them, like
+            sale_timesheet, is installed."""
+    )
+    backfill_date_to = fields.Date('Backfill to',
+        help="Last day of the Toggl history to backfill"
+    )
+    backfill_done_until = fields.Date('Backfilled until',
+        help="""Last day backfilled so far. An interrupted backfill
+            continues from the day after, new backfill dates start over.""",
+        readonly=True
+    )
+    toggl_user_ids = fields.One2many('toggl.user', 'connector_id',
+        string='Toggl users',
+        help="Workspace users of Toggl and the Odoo users and employees they are linked to",
+        readonly=True
+    )
+    api_requests_sent = fields.Integer('Requests sent', readonly=True)
+    api_requests_throttled = fields.Integer('Requests throttled', readonly=True)
+    api_requests_retried = fields.Integer('Requests retried', readonly=True)
 
-    # All Toggl projects, clients and tasks
-    toggl_clients = []
-    toggl_projects = []
-    toggl_tasks = {}
+    @api.multi
+    def write(self, vals):
+        if 'backfill_date_from' in vals or 'backfill_date_to' in vals:
+            # New backfill dates start a new backfill
+            vals = dict(vals)
+            vals.setdefault('backfill_done_until', False)
+        return super(TogglConnector, self).write(vals)
 
     @api.multi
-    def sync_time_entries_from_toggl(self, date_from, date_to, update_entries):
+    def sync_time_entries_from_toggl(self, date_from, date_to, update_entries, commit=True, recheck=False,
+                                     sync=None):
         self.ensure_one()
         user = self.env['res.users'].browse(self.env.uid)
         employee = self.env['hr.employee'].search([('user_id', '=', user.id)])
@@ -86,94 +210,594 @@ class TogglConnector(models.Model):
         # Synced entries
         synced_entries = []
 
-        # Fetch all workspace users
-        toggl_users = self.users(self.toggl_workspace_id)
-
-        # Pick correct Toggl user
-        toggl_user = next(filter(lambda c: c['email']==user.toggl_username, toggl_users), None)
+        # Pick correct Toggl user from the workspace user mapping
+        toggl_user = self.env['toggl.user'].sudo().find_user(self, user)
 
         if not toggl_user:
             raise Warning ('Please check that your Toggl Username (Email) is correct in Odoo')
 
-        report_params = {
+        employees = {toggl_user.toggl_uid: employee.id}
+
+        if recheck:
+            # The re-check window, including entries deleted in Toggl
+            return synced_entries + self.recheck_time_entries(
+                employees, fields.Date.today(), commit, sync=sync)
+
+        report_params = self.report_params(employees, date_from, date_to)
+        synced_entries += self.import_time_entries(report_params, employees, update_entries, commit,
+                                                   sync=sync)
+        return synced_entries
+
+    @api.multi
+    def import_workspace_time_entries_button(self):
+        self.ensure_one()
+        self.run_locked_from_ui('import_workspace_time_entries')
+
+    @api.model
+    def import_workspace_time_entries_cron(self):
+        return self.run_connectors('import_workspace_time_entries')
+
+    @api.multi
+    def import_workspace_time_entries(self):
+        self.ensure_one()
+
+        # Import from the last imported day, or the last week on the first run
+        date_to = fields.Date.today()
+        date_from = self.last_workspace_import or fields.Date.to_string(
+            fields.Date.from_string(date_to) - timedelta(days=7))
+
+        with self.record_run('workspace_import') as sync:
+            self.sync_workspace_time_entries_from_toggl(
+                date_from, date_to, True, recheck=self.toggl_recheck, sync=sync)
+        self.last_workspace_import = date_to
+        self.flush_api_stats()
+
+    @api.multi
+    def backfill_time_entries_button(self):
+        self.ensure_one()
+        if not (self.backfill_date_from and self.backfill_date_to):
+            raise Warning("Please give the dates to backfill time entries for")
+        self.run_locked_from_ui('run_backfill')
+
+    @api.multi
+    def run_backfill(self):
+        self.ensure_one()
+        with self.record_run('backfill') as sync:
+            self.backfill_time_entries(sync)
+        self.flush_api_stats()
+
+    @api.multi
+    def backfill_time_entries(self, sync=None):
+        # First import of the Toggl history of all linked users. The report is
+        # streamed shard by shard and new entries are inserted with multi-row
+        # INSERTs instead of one create() each, or with create() when modules
+        # extending it are installed. Entries already in Odoo are left alone,
+        # use the normal import to update them.
+        # Progress is committed after every shard, and a backfill stopped by
+        # the time budget or an error continues after the last finished shard.
+        self.ensure_one()
+        sync = sync or self.sync_context()
+        employees = self.get_toggl_employees()
+        if not employees:
+            logger.warning("Toggl: No Odoo employees are linked to Toggl users")
+            return sync
+
+        date_from = self.backfill_date_from
+        if self.backfill_done_until and self.backfill_done_until >= date_from:
+            date_from = fields.Date.to_string(
+                fields.Date.from_string(self.backfill_done_until) + timedelta(days=1))
+        deadline = time.time() + self.toggl_sync_time_budget if self.toggl_sync_time_budget else None
+        start = time.time()
+
+        for since, until in self.report_shards(date_from, self.backfill_date_to):
+            if deadline and time.time() > deadline:
+                logger.info("Toggl: Backfill time budget used, continuing from %s on the next run" % since)
+                break
+
+            batch = []
+            pages = self.iter_detailed_report(self.report_params(employees, since, until))
+            while True:
+                with sync.timer.phase('fetch'):
+                    time_entries = next(pages, None)
+                if time_entries is not None:
+                    batch += time_entries
+                if batch and (time_entries is None or len(batch) >= BACKFILL_BATCH_SIZE):
+                    self.insert_time_entries(sync, batch, employees)
+                    batch = []
+                if time_entries is None:
+                    break
+
+            # Checkpoint
+            self.backfill_done_until = until
+            self.commit_progress()
+
+        elapsed = time.time() - start
+        logger.info("Toggl: Backfilled %s time entries (%s skipped) in %.0fs, %.0f rows/s (%s)" % (
+            sync.stats['created'], sync.stats['skipped'] + sync.stats['unchanged'],
+            elapsed, sync.stats['created'] / elapsed if elapsed else 0.0, sync.timer))
+        return sync
+
+    def insert_time_entries(self, sync, time_entries, employees):
+        # Insert the new time entries of a batch in bulk
+        page_size = len(time_entries)
+        time_entries = [te for te in time_entries if te['uid'] in employees]
+        sync.stats['skipped'] += page_size - len(time_entries)
+
+        with sync.timer.phase('resolve'):
+            tasks, projects, existing = self.prefetch_time_entry_maps(time_entries)
+            timezones = self.employee_timezones(employees.values())
+
+        with sync.timer.phase('prepare'):
+            timesheets = {}
+            for time_entry in time_entries:
+                if time_entry['id'] in existing or time_entry['id'] in timesheets:
+                    sync.stats['unchanged'] += 1
+                    continue
+                timesheets[time_entry['id']] = self.time_entry_timesheet(
+                    time_entry, employees, tasks, projects, timezones)
+
+        with sync.timer.phase('insert'):
+            if self.bulk_insert_allowed():
+                created = self.bulk_insert_time_entries(list(timesheets.values()))
+            else:
+                created = self.create_time_entries(list(timesheets.values()))
+        sync.stats['entries'] += len(time_entries)
+        sync.stats['created'] += len(created)
+        return created
+
+    def bulk_insert_allowed(self):
+        # Raw INSERTs skip every create() override, so only use them when
+        # no installed module is known to extend create() of timesheet lines
+        return not self.env['ir.module.module'].sudo().search_count([
+            ('name', 'in', BACKFILL_CREATE_MODULES),
+            ('state', '=', 'installed'),
+        ])
+
+    def bulk_insert_time_entries(self, timesheets):
+        # Insert timesheet lines with raw multi-row INSERTs, filling in what
+        # create() would in this module's dependencies: the employee's user,
+        # the account's company, the customer of the task or project, the
+        # company's timesheet unit and the cost of the time. Overrides of
+        # create() in other modules do not run. Stored computed fields depending on the
+        # lines, like task effective hours, are recomputed once for all of them
+        # afterwards.
+        if not timesheets:
+            return []
+
+        employees = {employee['id']: employee for employee in self.env['hr.employee'].search_read(
+            [('id', 'in', list({t['employee_id'] for t in timesheets}))],
+            ['user_id', 'timesheet_cost'])}
+        companies = {account['id']: account['company_id'] and account['company_id'][0]
+                     for account in self.env['account.analytic.account'].search_read(
+                         [('id', 'in', list({t['account_id'] for t in timesheets}))], ['company_id'])}
+        uoms = {company['id']: company['project_time_mode_id'] and company['project_time_mode_id'][0]
+                for company in self.env['res.company'].sudo().search_read(
+                    [('id', 'in', list(set(companies.values()) | {self.company_id.id}))],
+                    ['project_time_mode_id'])}
+
+        # Customer of the line, from its task or else its project
+        task_partners = {task['id']: task['partner_id'] and task['partner_id'][0]
+                         for task in self.env['project.task'].search_read(
+                             [('id', 'in', list({t['task_id'] for t in timesheets if t.get('task_id')}))],
+                             ['partner_id'])}
+        project_partners = {project['id']: project['partner_id'] and project['partner_id'][0]
+                            for project in self.env['project.project'].search_read(
+                                [('id', 'in', list({t['project_id'] for t in timesheets}))],
+                                ['partner_id'])}
+
+        columns = ['name', 'date', 'unit_amount', 'amount', 'account_id', 'project_id', 'task_id',
+                   'employee_id', 'user_id', 'company_id', 'partner_id', 'product_uom_id',
+                   'toggl_entry_id', 'toggl_fingerprint', 'create_uid', 'write_uid']
+        rows = []
+        for timesheet in timesheets:
+            employee = employees.get(timesheet['employee_id']) or {}
+            company_id = companies.get(timesheet['account_id']) or self.company_id.id
+            if timesheet.get('task_id'):
+                partner_id = task_partners.get(timesheet['task_id'])
+            else:
+                partner_id = project_partners.get(timesheet['project_id'])
+            rows.append([
+                timesheet['name'],
+                timesheet['date'],
+                timesheet['unit_amount'],
+                round(-timesheet['unit_amount'] * (employee.get('timesheet_cost') or 0.0), 2),
+                timesheet['account_id'],
+                timesheet['project_id'],
+                timesheet.get('task_id') or None,
+                timesheet['employee_id'],
+                employee.get('user_id') and employee['user_id'][0] or None,
+                company_id,
+                partner_id or None,
+                uoms.get(company_id) or None,
+                timesheet['toggl_entry_id'],
+                timesheet['toggl_fingerprint'],
+                self.env.uid,
+                self.env.uid,
+            ])
+
+        AnalyticLine = self.env['account.analytic.line']
+        placeholders = '(%s)' % ', '.join(['%s'] * len(columns) + ["(now() at time zone 'UTC')"] * 2)
+        created = []
+        for chunk in split_every(BACKFILL_BATCH_SIZE, rows):
+            query = """
+                INSERT INTO "{table}" ({columns}, create_date, write_date)
+                VALUES {values}
+                RETURNING id
+            """.format(
+                table=AnalyticLine._table,
+                columns=', '.join('"%s"' % column for column in columns),
+                values=', '.join([placeholders] * len(chunk)),
+            )
+            self.env.cr.execute(query, [value for row in chunk for value in row])
+            created += [row[0] for row in self.env.cr.fetchall()]
+
+        # Recompute related and computed fields of the lines and of their tasks and projects
+        lines = AnalyticLine.browse(created)
+        lines.modified(columns)
+        AnalyticLine.recompute()
+        logger.debug("Toggl: Inserted %s time entries" % len(created))
+        return created
+
+    def sync_workspace_time_entries_from_toggl(self, date_from, date_to, update_entries, commit=True,
+                                               recheck=False, sync=None):
+        # Import time entries of every Odoo user linked to Toggl in one pass
+        self.ensure_one()
+        self.toggl_api_init()
+
+        employees = self.get_toggl_employees()
+        if not employees:
+            logger.warning("Toggl: No Odoo employees are linked to Toggl users")
+            return []
+
+        if recheck:
+            # The days since date_from and the re-check window,
+            # including entries deleted in Toggl
+            synced_entries = self.recheck_time_entries(employees, date_from, commit, sync=sync)
+            date_to = fields.Date.today()
+        else:
+            report_params = self.report_params(employees, date_from, date_to)
+            synced_entries = self.import_time_entries(report_params, employees, update_entries, commit,
+                                                      sync=sync)
+
+        # Update toggl_last_fetch to the imported users in Odoo
+        # .sudo() because we are only touching the toggl_last_fetch-field...
+        self.env['hr.employee'].browse(list(employees.values())).mapped('user_id').sudo().write({
+            'toggl_last_fetch': date_to,
+        })
+        return synced_entries
+
+    def get_toggl_employees(self):
+        # Return Toggl user id --> Odoo employee id for all linked users
+        return self.env['toggl.user'].sudo().employee_map(self)
+
+    @api.model
+    def refresh_toggl_users_cron(self):
+        return self.run_connectors('refresh_toggl_users')
+
+    @api.multi
+    def refresh_toggl_users(self):
+        # Fetch the workspace users from Toggl and link them to Odoo users
+        self.ensure_one()
+        self.env['toggl.user'].sudo().refresh_users(self)
+        self.flush_api_stats()
+
+    def recheck_time_entries(self, employees, date_from, commit=True, sync=None):
+        # Import the time entries from date_from, or from the start of the
+        # re-check window if that is earlier, and remove entries deleted in
+        # Toggl. The Reports API can't filter on update time, so the whole
+        # range is read and unchanged lines are skipped by fingerprint.
+        date_to = fields.Date.today()
+        window_from = fields.Date.to_string(
+            fields.Date.from_string(date_to) - timedelta(days=self.toggl_recheck_days or 60))
+        date_from = min(date_from or window_from, window_from)
+
+        sync = sync or self.sync_context()
+        report_params = self.report_params(employees, date_from, date_to)
+        synced_entries = self.import_time_entries(report_params, employees, True, commit, sync=sync)
+
+        # The whole range was read, so entries missing from it are deleted in Toggl
+        self.delete_missing_time_entries(sync, list(employees.values()), date_from, date_to)
+        return synced_entries
+
+    def delete_missing_time_entries(self, sync, employee_ids, date_from, date_to):
+        # Remove imported timesheet lines whose Toggl entry was not in the report.
+        # Lines are dated in the employee's timezone and the report in that of
+        # the token's user, so the first and last day may hold lines of entries
+        # outside the report: only lines dated strictly inside it are checked.
+        inner_from = fields.Date.from_string(date_from) + timedelta(days=1)
+        inner_to = fields.Date.from_string(date_to) - timedelta(days=1)
+        if inner_from > inner_to:
+            return []
+        lines = self.env['account.analytic.line'].search_read([
+            ('employee_id', 'in', employee_ids),
+            ('toggl_entry_id', '!=', 0),
+            ('date', '>=', fields.Date.to_string(inner_from)),
+            ('date', '<=', fields.Date.to_string(inner_to)),
+        ], ['toggl_entry_id'])
+        deleted = [l['id'] for l in lines if l['toggl_entry_id'] not in sync.entry_ids]
+
+        if deleted:
+            logger.debug("Toggl: Delete %s time entries removed from Toggl" % len(deleted))
+            self.env['account.analytic.line'].browse(deleted).unlink()
+        sync.stats['deleted'] += len(deleted)
+        return deleted
+
+    def report_params(self, employees, date_from, date_to):
+        # Detailed report parameters for the given Toggl users
+        return {
             'workspace_id': self.toggl_workspace_id,
-            'user_ids': toggl_user['uid'],
+            'user_ids': ','.join(str(uid) for uid in sorted(employees)),
             'since': date_from,
             'until': date_to,
             'page': 1,
         }
 
-        time_entries = []
+    def import_time_entries(self, report_params, employees, update_entries, commit=True, sync=None):
+        # Import the time entries of a detailed report for the given
+        # employees (Toggl user id --> Odoo employee id).
+        synced_entries = []
+        sync = sync or self.sync_context()
 
-        # Get detailed report of Toggl time entries, one page at a time
+        # Process the detailed report one page at a time as it arrives,
+        # the next page is downloaded while the current one is written
+        pages = self.iter_detailed_report(report_params)
         while True:
-            time_entries_page = self.detailed_report(params=report_params)
-            report_params['page']+=1
-            time_entries += time_entries_page['data']
-
-            if not time_entries_page['data']:
+            with sync.timer.phase('fetch'):
+                time_entries = next(pages, None)
+            if time_entries is None:
                 break
 
-        # Process time entries and insert/update them in Odoo
-        for time_entry in time_entries:
-            # Duration in hours (msec --> hour)
-            duration = round(time_entry['dur'] / 1000.0 / 3600.0, 2)
-
-            if not time_entry['description']:
-              time_entry['description'] = "/"
-
-            if not time_entry['project']:
-              time_entry['project'] = ""
-
-            timesheet = {
-                'name': time_entry['description'],
-                'employee_id': employee.id,
-                'date': time_entry['start'][0:10],
-                'project_id': self.toggl_default_project.id,
-                'account_id': self.toggl_default_project.analytic_account_id.id,
-                'unit_amount': duration,
-                'toggl_entry_id': time_entry['id'],
-            }
+            synced_entries += self.import_time_entries_page(
+                sync, time_entries, employees, update_entries)
 
-            if time_entry['tid']:
-                # Match Toggl Task to Odoo Task and Project
-                task = self.env['project.task'].search([
-                    ('toggl_task_id', '=', time_entry['tid'])
-                ], limit=1)
-                if task:
-                    timesheet['task_id'] = task.id
-                    if task.project_id:
-                        timesheet['project_id'] =  task.project_id.id
-                        timesheet['account_id'] =  task.project_id.analytic_account_id.id
-            elif time_entry['pid']:
-                # Match Toggl Project to Odoo Project
-                project = self.env['project.project'].search([
-                    ('toggl_project_id', '=', time_entry['pid'])
-                ], limit=1)
-                if project:
-                    timesheet['project_id'] =  project.id
-                    timesheet['account_id'] =  project.analytic_account_id.id
-
-            # Check if entry exists in Odoo
-            odoo_te = self.env['account.analytic.line'].search([
-                ('toggl_entry_id', '=', time_entry['id']),
-            ], limit=1)
-
-            if not odoo_te:
-                # Create  time entry
-                logger.debug("Toggl: Create time entry: %s" % (timesheet['name']))
-                entryid = self.env['account.analytic.line'].create(timesheet)
-                synced_entries.append(entryid.id)
-            elif update_entries:
-                # Update time entry
-                logger.debug("Toggl: Update time entry: %s" % (timesheet['name']))
-                try:
-                    odoo_te.write(timesheet)
-                    synced_entries.append(odoo_te.id)
-                except Exception as e:
-                    logger.warning("Toggl: Update time entry failed! %s" % (e))
+            # Keep what has been imported so far
+            if commit:
+                self.commit_progress()
+
+        logger.info("Toggl: Imported %s time entries (%s created, %s updated, %s unchanged, %s skipped) in %s" % (
+            sync.stats['entries'], sync.stats['created'], sync.stats['updated'],
+            sync.stats['unchanged'], sync.stats['skipped'], sync.timer))
+        return synced_entries
+
+    def iter_detailed_report(self, params):
+        # Yield the detailed report page by page, in date and page order.
+        # The date range is split into shards whose pages are downloaded in
+        # parallel, a few pages ahead of the caller. The first page of a shard
+        # tells how many pages it has, so no request is made for an empty page.
+        # The worker threads only do HTTP and never touch the ORM.
+        client = self.toggl_api()
+        url = self.detailed_report_url()
+        shards = self.report_shards(params['since'], params['until'])
+        workers = max(min(self.toggl_max_parallel, self.toggl_pool_size or 10), 1)
+
+        @client.bound
+        def fetch(shard, page):
+            response = client.request('get', url, params=dict(
+                params, since=shard[0], until=shard[1], page=page))
+            # Keep only the fields the import uses
+            response['data'] = project_records(response.get('data'), TogglTimeEntry)
+            return response
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            first_pages = [executor.submit(fetch, shard, 1) for shard in shards]
+
+            def ordered_pages():
+                # Futures of all pages in order, later pages are only
+                # requested once the shard's page count is known
+                for shard, first_page in zip(shards, first_pages):
+                    yield first_page
+                    for page in range(2, self.report_page_count(first_page.result()) + 1):
+                        yield executor.submit(fetch, shard, page)
+
+            pages = ordered_pages()
+            pending = deque()
+            try:
+                while True:
+                    while len(pending) < workers * 2:
+                        future = next(pages, None)
+                        if future is None:
+                            break
+                        pending.append(future)
+                    if not pending:
+                        break
+                    time_entries_page = pending.popleft().result()
+                    if time_entries_page.get('data'):
+                        yield time_entries_page['data']
+            except TogglApiError as e:
+                raise Warning(str(e))
+            finally:
+                for future in first_pages + list(pending):
+                    future.cancel()
+
+    def report_shards(self, date_from, date_to):
+        # Split a date range into (since, until) shards of toggl_report_shard_days
+        date_from = fields.Date.from_string(date_from)
+        date_to = fields.Date.from_string(date_to)
+        days = max(self.toggl_report_shard_days or 31, 1)
+        shards = []
+        while date_from <= date_to:
+            until = min(date_from + timedelta(days=days - 1), date_to)
+            shards.append((fields.Date.to_string(date_from), fields.Date.to_string(until)))
+            date_from = until + timedelta(days=1)
+        return shards
+
+    def report_page_count(self, response):
+        # Number of pages of a detailed report, from its first page
+        per_page = response.get('per_page') or len(response.get('data') or []) or 1
+        return int(math.ceil((response.get('total_count') or 0) / float(per_page)))
+
+    def import_time_entries_page(self, sync, time_entries, employees, update_entries):
+        # Insert/update one batch of Toggl time entries in Odoo
+        timer = sync.timer
+
+        # Only entries of the given Toggl users are imported
+        page_size = len(time_entries)
+        time_entries = [te for te in time_entries if te['uid'] in employees]
+        sync.stats['skipped'] += page_size - len(time_entries)
+
+        # Resolve Toggl ids to Odoo records with one query per model
+        with timer.phase('resolve'):
+            tasks, projects, existing = self.prefetch_time_entry_maps(time_entries)
+            timezones = self.employee_timezones(employees.values())
+
+        # Build timesheet values for every time entry
+        with timer.phase('prepare'):
+            to_create = []
+            to_write = {}
+            for time_entry in time_entries:
+                sync.entry_ids.add(time_entry['id'])
+
+                timesheet = self.time_entry_timesheet(time_entry, employees, tasks, projects, timezones)
+
+                # Entry already imported with exactly the same values, both the
+                # Toggl data and the Odoo task/project it maps to are unchanged
+                odoo_te = existing.get(time_entry['id'])
+                if odoo_te and odoo_te['toggl_fingerprint'] == timesheet['toggl_fingerprint']:
+                    sync.stats['unchanged'] += 1
+                    continue
+
+                if not odoo_te:
+                    to_create.append(timesheet)
+                elif update_entries:
+                    # Only write the fields that actually changed
+                    changes = {
+                        field: value for field, value in timesheet.items()
+                        if odoo_te.get(field) != value
+                    }
+                    to_write[odoo_te['id']] = changes
+
+        synced_entries = []
+        with timer.phase('create'):
+            synced_entries += self.create_time_entries(to_create)
+
+        with timer.phase('write'):
+            synced_entries += self.write_time_entries(to_write, sync)
+
+        sync.stats['entries'] += len(time_entries)
+        sync.stats['created'] += len(to_create)
+        sync.stats['updated'] += len(to_write)
         return synced_entries
 
+    def time_entry_timesheet(self, time_entry, employees, tasks, projects, timezones):
+        # Timesheet line values of a Toggl time entry, booked on the
+        # day it started in the timezone of the employee
+        # Duration in hours (msec --> hour)
+        duration = round(time_entry['dur'] / 1000.0 / 3600.0, 2)
+
+        if not time_entry['description']:
+          time_entry['description'] = "/"
+
+        if not time_entry['project']:
+          time_entry['project'] = ""
+
+        timesheet = {
+            'name': time_entry['description'],
+            'employee_id': employees[time_entry['uid']],
+            'date': toggl_local_date(time_entry['start'], timezones.get(employees[time_entry['uid']])),
+            'project_id': self.toggl_default_project.id,
+            'account_id': self.toggl_default_project.analytic_account_id.id,
+            'task_id': False,
+            'unit_amount': duration,
+            'toggl_entry_id': time_entry['id'],
+        }
+
+        if time_entry['tid']:
+            # Match Toggl Task to Odoo Task and Project
+            task = tasks.get(time_entry['tid'])
+            if task:
+                timesheet['task_id'] = task['id']
+                project = projects['id'].get(task['project_id'])
+                if project:
+                    timesheet['project_id'] = project['id']
+                    timesheet['account_id'] = project['analytic_account_id']
+        elif time_entry['pid']:
+            # Match Toggl Project to Odoo Project
+            project = projects['toggl_project_id'].get(time_entry['pid'])
+            if project:
+                timesheet['project_id'] = project['id']
+                timesheet['account_id'] = project['analytic_account_id']
+
+        timesheet['toggl_fingerprint'] = timesheet_fingerprint(timesheet)
+        return timesheet
+
+    def employee_timezones(self, employee_ids):
+        # Employee id --> timezone of the employee's Odoo user
+        return {
+            employee.id: employee.user_id.tz or 'UTC'
+            for employee in self.env['hr.employee'].browse(list(set(employee_ids)))
+        }
+
+    def prefetch_time_entry_maps(self, time_entries):
+        # Collect all Toggl ids referenced by the report
+        tids = list({te['tid'] for te in time_entries if te['tid']})
+        pids = list({te['pid'] for te in time_entries if te['pid']})
+        entry_ids = list({te['id'] for te in time_entries})
+
+        # Toggl task id --> task
+        tasks = {}
+        if tids:
+            for task in self.env['project.task'].search_read(
+                    [('toggl_task_id', 'in', tids)], ['toggl_task_id', 'project_id']):
+                task['project_id'] = task['project_id'] and task['project_id'][0]
+                tasks.setdefault(task['toggl_task_id'], task)
+
+        # Odoo project id and Toggl project id --> project
+        projects = {'id': {}, 'toggl_project_id': {}}
+        project_ids = list({t['project_id'] for t in tasks.values() if t['project_id']})
+        if pids or project_ids:
+            # Tasks may point to archived projects, Toggl project ids only match active ones
+            for project in self.env['project.project'].with_context(active_test=False).search_read([
+                    '|',
+                    ('toggl_project_id', 'in', pids),
+                    ('id', 'in', project_ids),
+                    ], ['toggl_project_id', 'analytic_account_id', 'active']):
+                project['analytic_account_id'] = (
+                    project['analytic_account_id'] and project['analytic_account_id'][0])
+                projects['id'][project['id']] = project
+                if project['toggl_project_id'] and project['active']:
+                    projects['toggl_project_id'].setdefault(project['toggl_project_id'], project)
+
+        # Toggl time entry id --> current values of the existing timesheet line
+        existing = {}
+        if entry_ids:
+            for line in self.env['account.analytic.line'].search_read(
+                    [('toggl_entry_id', 'in', entry_ids)], TIMESHEET_FIELDS):
+                for field in MANY2ONE_TIMESHEET_FIELDS:
+                    line[field] = line[field] and line[field][0]
+                existing.setdefault(line['toggl_entry_id'], line)
+
+        return tasks, projects, existing
+
+    def create_time_entries(self, timesheets):
+        # Odoo 11 create() takes one record at a time,
+        # but everything it needs has already been resolved
+        AnalyticLine = self.env['account.analytic.line']
+        created = []
+        for timesheet in timesheets:
+            logger.debug("Toggl: Create time entry: %s" % (timesheet['name']))
+            created.append(AnalyticLine.create(timesheet).id)
+        return created
+
+    def write_time_entries(self, timesheets, sync=None):
+        # Group lines getting identical values into one write() each
+        groups = defaultdict(list)
+        for line_id, timesheet in timesheets.items():
+            groups[tuple(sorted(timesheet.items()))].append(line_id)
+
+        written = []
+        AnalyticLine = self.env['account.analytic.line']
+        for values, line_ids in groups.items():
+            values = dict(values)
+            logger.debug("Toggl: Update time entries: %s" % (line_ids))
+            try:
+                AnalyticLine.browse(line_ids).write(values)
+                written += line_ids
+            except Exception as e:
+                logger.warning("Toggl: Update time entry failed! %s" % (e))
+                if sync:
+                    sync.stats['errors'] += 1
+        return written
+
     @api.multi
     def sync_projects_to_toggl_button(self):
         self.ensure_one()
@@ -181,60 +805,315 @@ class TogglConnector(models.Model):
         toggl = self.env['toggl.connector'].search([
             ('company_id', '=', user.company_id.id)
         ])
-        toggl.sync_projects_to_toggl()
-        toggl.sync_tasks_to_toggl()
+        toggl.run_locked_from_ui('sync_to_toggl', True)
+
+    @api.multi
+    def full_refresh_button(self):
+        # Sync everything against a freshly fetched workspace,
+        # ignoring the cached snapshot
+        self.ensure_one()
+        self.run_locked_from_ui('sync_to_toggl', True)
 
     @api.model
     def sync_to_toggl_cron(self, sync_all=False):
-        user = self.env['res.users'].browse(self.env.uid)
-        toggl = self.env['toggl.connector'].search([
-            ('company_id', '=', user.company_id.id)
-        ])
+        return self.run_connectors('sync_to_toggl', sync_all)
 
-        # Sync everything checked or when running sync first time, we sync all projects/tasks
-        if sync_all or not toggl.last_cron_run:
-            # Sync all projects and tasks
-            logger.debug("Toggl: Sync all projects to Toggl")
-            toggl.sync_projects_to_toggl()
-            return
+    @api.multi
+    def sync_to_toggl(self, sync_all=False):
+        self.ensure_one()
+        with self.record_run('sync') as sync:
+            self.run_sync_job(sync_all, sync=sync)
+        self.flush_api_stats()
 
-        # Which records to include in sync
-        time_from = toggl.last_cron_run
-        logger.debug("Toggl: Cron last run: %s" % time_from)
+    @api.model
+    def run_connectors(self, method, *args):
+        # Run `method` of every company's connector in parallel, each in its
+        # own thread, transaction and company context. At most
+        # toggl_connector.max_parallel_connectors connectors run at a time,
+        # so the cron takes about as long as the slowest workspace.
+        connector_ids = self.sudo().search([]).ids
+        limit = int(self.env['ir.config_parameter'].sudo().get_param(
+            'toggl_connector.max_parallel_connectors', 4) or 1)
+        start = time.time()
+
+        if getattr(threading.currentThread(), 'testing', False) or len(connector_ids) < 2:
+            summary = [self.run_connector(toggl_id, method, args) for toggl_id in connector_ids]
+        else:
+            with ThreadPoolExecutor(max_workers=max(min(limit, len(connector_ids)), 1)) as executor:
+                summary = list(executor.map(
+                    lambda toggl_id: self.run_connector(toggl_id, method, args), connector_ids))
+
+        logger.info("Toggl: %s of %s connectors in %.2fs: %s" % (
+            method, len(summary), time.time() - start, ', '.join(
+                '%(company)s %(state)s (%(duration).2fs)' % result for result in summary)))
+        return summary
+
+    def run_connector(self, connector_id, method, args):
+        # Run one connector's method in its own transaction and return a summary.
+        # A connector already running elsewhere (e.g. an overlapping cron) is skipped.
+        result = {'connector_id': connector_id, 'company': connector_id,
+                  'state': 'done', 'duration': 0.0, 'error': False}
+        start = time.time()
+        try:
+            with self.connector_env() as env:
+                toggl = env['toggl.connector'].sudo().browse(connector_id)
+                result['company'] = toggl.company_id.name
+                toggl = toggl.with_context(force_company=toggl.company_id.id)
+                if not toggl.run_locked(method, *args):
+                    logger.info("Toggl: Connector of %s is busy, skipped" % result['company'])
+                    result['state'] = 'busy'
+        except Exception as e:
+            logger.exception("Toggl: %s failed for %s" % (method, result['company']))
+            result.update(state='failed', error=str(e))
+        finally:
+            result['duration'] = time.time() - start
+        return result
+
+    @contextmanager
+    def connector_env(self):
+        # Environment with a new cursor for a connector's thread,
+        # the current one while running tests
+        if getattr(threading.currentThread(), 'testing', False):
+            yield self.env
+            return
+        threading.currentThread().dbname = self.env.cr.dbname
+        with api.Environment.manage():
+            with self.pool.cursor() as cr:
+                yield api.Environment(cr, self.env.uid, self.env.context)
+
+    def run_locked(self, method, *args):
+        # Run a method of the connector holding its lock, False when the
+        # connector is busy. The lock lives in the database session, which
+        # goes back to the connection pool, so it is released even when the
+        # method aborted the transaction with an SQL error.
+        self.ensure_one()
+        if not self.try_lock():
+            return False
+        testing = getattr(threading.currentThread(), 'testing', False)
+        try:
+            if testing:
+                # Nothing is committed while running tests, undo just the method
+                with self.env.cr.savepoint():
+                    getattr(self, method)(*args)
+            else:
+                getattr(self, method)(*args)
+        except Exception:
+            if not testing:
+                # Chunks done so far are committed, drop the failed rest
+                # so that the unlock below can run
+                self.env.cr.rollback()
+            raise
+        finally:
+            self.unlock()
+        return True
+
+    def run_locked_from_ui(self, method, *args):
+        # Run a method from a button, unless a cron is running the connector.
+        # A full sync restarts the sync job, chunks left are continued by the cron.
+        if not self.run_locked(method, *args):
+            raise Warning("Toggl connector is busy, please try again later")
+
+    def try_lock(self):
+        # Session level advisory lock, kept over the commits of a chunked run
+        self.env.cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (TOGGL_LOCK_KEY, self.id))
+        return self.env.cr.fetchone()[0]
+
+    def unlock(self):
+        self.env.cr.execute("SELECT pg_advisory_unlock(%s, %s)", (TOGGL_LOCK_KEY, self.id))
+
+    def run_sync_job(self, sync_all=False, sync=None):
+        # Sync projects and tasks to Toggl in chunks, committing and
+        # checkpointing after each chunk. An interrupted run is resumed from
+        # its checkpoint, and the latest run timestamp only moves forward
+        # when all chunks are done.
+        self.ensure_one()
+        job = self.env['toggl.sync.job'].get_job(self)
+        chunk_size = self.toggl_sync_chunk_size or 50
+
+        if job.state != 'running' or sync_all:
+            # Sync everything checked or when running sync first time, we sync all projects/tasks.
+            # A full sync restarts a running job.
+            time_from = False if sync_all else self.last_cron_run
+            logger.debug("Toggl: Cron last run: %s" % time_from)
+            job.start(time_from, fields.Datetime.now(),
+                      self.env['project.project'].search(self.project_domain(time_from)).ids)
+            self.commit_progress()
+        else:
+            logger.info("Toggl: Resume sync from chunk %s (%s)" % (job.chunks_done, job.stage))
+
+        sync = sync or self.sync_context()
+        with sync.timer.phase('load'):
+            self.load_toggl_projects(sync, full=not job.time_from)
+        deadline = time.time() + self.toggl_sync_time_budget if self.toggl_sync_time_budget else None
+
+        while job.state == 'running':
+            if deadline and time.time() > deadline:
+                logger.info("Toggl: Sync time budget used, continuing on the next run")
+                self.save_snapshot(sync)
+                return job
+
+            chunk = job.next_chunk(chunk_size)
+            if not chunk:
+                if job.stage == 'projects':
+                    # Projects done, sync the tasks of all projects linked to Toggl,
+                    # or in a delta run only of those with touched tasks
+                    if job.time_from:
+                        task_project_ids = self.touched_task_project_ids(
+                            job.time_from, self.get_task_types())
+                    else:
+                        task_project_ids = self.env['project.project'].search([
+                            ('toggl_project_id', '!=', 0),
+                        ]).ids
+                    job.next_stage('tasks', task_project_ids)
+                else:
+                    # All chunks done, move the high-water mark, unless chunks were
+                    # skipped: the next run then covers their records again
+                    if job.skipped_ids:
+                        logger.warning("Toggl: Chunks were skipped, latest run kept at %s" % self.last_cron_run)
+                    else:
+                        self.last_cron_run = job.time_to
+                    job.finish()
+                # The snapshot is saved once per stage, not after every chunk
+                self.save_snapshot(sync)
+                self.commit_progress()
+                continue
 
-        # Update timestamp
-        toggl.last_cron_run = fields.Datetime.now()
+            if job.chunk_failing():
+                sync.stats['errors'] += 1
+                sync.notes.append("Skipped %s chunk after %s failed attempts: %s" % (
+                    job.stage, job.chunk_attempts, chunk))
+                job.skip_chunk(chunk)
+                self.commit_progress()
+                continue
 
-        # Sync projects and tasks
-        toggl.sync_projects_to_toggl(time_from)
-        toggl.sync_tasks_to_toggl(time_from)
+            job.chunk_started()
+            self.commit_progress()
+            with sync.timer.phase(job.stage):
+                if job.stage == 'projects':
+                    self.sync_projects_to_toggl(job.time_from, sync=sync, project_ids=chunk, save=False)
+                else:
+                    self.sync_tasks_to_toggl(job.time_from, sync=sync, project_ids=chunk, save=False)
+            job.chunk_done(chunk)
+            self.commit_progress()
+        return job
+
+    def commit_progress(self):
+        # Commit the work done so far, unless running tests
+        if not getattr(threading.currentThread(), 'testing', False):
+            self.env.cr.commit()
 
     @api.model
     def archive_completed_tasks_projects_cron(self):
-        user = self.env['res.users'].browse(self.env.uid)
-        toggl = self.env['toggl.connector'].search([
-            ('company_id', '=', user.company_id.id)
-        ])
+        return self.run_connectors('archive_in_toggl')
 
+    @api.multi
+    def archive_in_toggl(self):
+        self.ensure_one()
         # Arcive completed
-        toggl.archive_completed_projects_tasks()
+        with self.record_run('archive') as sync:
+            self.archive_completed_projects_tasks(sync=sync)
+        self.flush_api_stats()
 
-    def sync_projects_to_toggl(self, time_from=False):
+    def sync_context(self):
+        # New state for one sync run of this connector
         self.ensure_one()
-        self.toggl_api_init()
+        return SyncContext(self.toggl_api(), self.toggl_workspace_id)
 
-        # Fetch all clients from Toggl in one API call
-        # and keep them in a class variable
-        self.toggl_clients = self.clients(self.toggl_workspace_id)
-        if not self.toggl_clients:
-            self.toggl_clients = []
+    @contextmanager
+    def record_run(self, kind):
+        # Run the block with a new sync context and keep a toggl.sync.run
+        # of it: phase timings, HTTP latencies, SQL queries and counters
+        self.ensure_one()
+        sync = self.sync_context()
+        SyncRun = self.env['toggl.sync.run']
+        start = fields.Datetime.now()
+        started = time.time()
+        queries = getattr(self.env.cr, 'sql_log_count', 0)
+
+        with sync.api.recording() as latencies:
+            try:
+                yield sync
+            except Exception as e:
+                values = SyncRun.run_values(
+                    self, kind, sync, start, time.time() - started, latencies,
+                    getattr(self.env.cr, 'sql_log_count', 0) - queries, error=str(e))
+                if getattr(threading.currentThread(), 'testing', False):
+                    SyncRun.sudo().create(values)
+                else:
+                    # The transaction is rolled back, keep the failed run in its own
+                    with self.pool.cursor() as cr:
+                        SyncRun.with_env(self.env(cr=cr)).sudo().create(values)
+                raise
+
+        values = SyncRun.run_values(
+            self, kind, sync, start, time.time() - started, latencies,
+            getattr(self.env.cr, 'sql_log_count', 0) - queries)
+        SyncRun.sudo().create(values)
+        logger.info("Toggl: %s run done in %.2fs (%s)" % (kind, values['duration'], sync.timer))
+
+    def load_toggl_projects(self, sync, full=False):
+        # Load the workspace's clients, projects and tasks into the sync context.
+        # A fresh snapshot is used when there is one, and only objects changed
+        # in Toggl since the snapshot was taken are fetched.
+        snapshot = self.env['toggl.snapshot'].search([('connector_id', '=', self.id)])
+        if not full and snapshot.is_fresh(self.toggl_snapshot_ttl):
+            snapshot.load(sync)
+            if sync.since:
+                self.apply_toggl_changes(sync, self.me_changes(sync.since))
+                return
+            logger.debug("Toggl: Snapshot without a change cursor, fetching the workspace")
+
+        # Fetch all clients and projects from Toggl in one API call each
+        # and keep them in the sync context. The change cursor is taken on
+        # the Odoo clock before fetching and set back by a margin, changes
+        # fetched twice are applied again without harm.
+        sync.since = int(time.time()) - TOGGL_SINCE_MARGIN
+        sync.clients = TogglIndex(self.clients(self.toggl_workspace_id), TogglClient)
+        sync.projects = TogglIndex(self.projects(self.toggl_workspace_id, 'both'), TogglProject)
+        sync.tasks = {}
+        if self.toggl_snapshot_ttl:
+            self.env['toggl.snapshot'].store(self, sync, full=True)
+
+    def apply_toggl_changes(self, sync, changes):
+        # Merge clients, projects and tasks changed in Toggl into the sync context
+        data = changes.get('data') or {}
+        wid = self.toggl_workspace_id
+
+        for client in data.get('clients') or []:
+            if client.get('wid') != wid:
+                continue
+            if client.get('server_deleted_at'):
+                sync.clients.discard(client['id'])
+            else:
+                sync.clients.add(client)
 
-        # Fetch all projects from Toggl in one API call
-        # and keep them in a class variable
-        self.toggl_projects = self.projects(self.toggl_workspace_id, 'both')
-        if not self.toggl_projects:
-            self.toggl_projects = []
+        for project in data.get('projects') or []:
+            if project.get('wid') != wid:
+                continue
+            if project.get('server_deleted_at'):
+                sync.projects.discard(project['id'])
+                sync.tasks.pop(project['id'], None)
+            else:
+                sync.projects.add(project)
+
+        for task in data.get('tasks') or []:
+            # Tasks of projects not in the snapshot are fetched when needed
+            if task.get('wid') != wid or task.get('pid') not in sync.tasks:
+                continue
+            if task.get('server_deleted_at'):
+                sync.tasks[task['pid']].discard(task['id'])
+            else:
+                sync.tasks[task['pid']].add(task)
+
+        sync.since = changes.get('since') or sync.since
+        logger.debug("Toggl: Applied changes since %s from Toggl" % sync.since)
+
+    def save_snapshot(self, sync):
+        # Keep the workspace objects of this run for the next runs
+        if self.toggl_snapshot_ttl and sync.since:
+            self.env['toggl.snapshot'].store(self, sync)
 
+    def project_domain(self, time_from=False):
         # Skip these projects when syncing to Toggl
         skip_projects = self.toggl_skip_projects.mapped('name')
 
@@ -242,179 +1121,334 @@ class TogglConnector(models.Model):
         projectdomain = [
             ('active', '=', True),
             ('name', 'not in', skip_projects),
+            ('company_id', '=', self.company_id.id),
         ]
 
         if time_from:
             # Only projects that are touched since the last run
             projectdomain.append(('write_date', '>=', time_from))
+        return projectdomain
 
-        projects = self.env['project.project'].search(projectdomain)
-
-        for project in projects:
-            client_id = 0
-
-            if project.partner_id:
-                client_id = self.create_toggl_client({
-                    'name': project.partner_id.name,
-                    'toggl_id': project.partner_id.toggl_partner_id,
-                })
-                # Update Toggl Client id to partner in Odoo
-                # .sudo() because we are only touching the toggl_partner_id-field...
-                project.partner_id.sudo().write({
-                    'toggl_partner_id': client_id,
-                })
+    def sync_projects_to_toggl(self, time_from=False, sync=None, full=False, project_ids=None, save=True):
+        self.ensure_one()
+        sync = sync or self.sync_context()
+        if full or sync.projects is None:
+            self.load_toggl_projects(sync, full=full)
 
-            # Create Toggl project
-            toggl_pid = self.create_toggl_project({
-                'name': project.name,
-                'id': project.id,
-                'client_id': client_id,
-                'toggl_id': project.toggl_project_id,
-            })
+        if project_ids is not None:
+            # Only these projects, e.g. one chunk of a sync job
+            projects = self.env['project.project'].browse(project_ids).exists()
+        else:
+            projects = self.env['project.project'].search(self.project_domain(time_from))
+
+        # Reconcile the client of each distinct partner only once
+        client_ids = self.sync_clients_to_toggl(sync, projects.mapped('partner_id'))
+
+        # Create and update Toggl projects, independent projects concurrently
+        calls = [self.toggl_project_call(sync, {
+            'name': project.name,
+            'id': project.id,
+            'client_id': client_ids.get(project.partner_id.id, 0),
+            'toggl_id': project.toggl_project_id,
+        }) for project in projects]
+        self.count_toggl_calls(sync, calls)
+
+        failures = []
+        for project, result in zip(projects, self.reconcile_toggl_objects(calls)):
+            if isinstance(result, TogglApiError):
+                failures.append((project, result))
+                continue
+            if isinstance(result, dict):
+                sync.projects.add(result)
+                result = result['id']
 
             # Update Toggl Project id to project in Odoo
-            # .sudo() because we are only touching the toggl_project_id-field...
-            project.sudo().write({
-                'toggl_project_id': toggl_pid,
+            sync.set_toggl_id(project, 'toggl_project_id', result)
+
+        self.flush_toggl_ids(sync)
+        if save:
+            self.save_snapshot(sync)
+        self.log_toggl_failures(sync, failures)
+        return sync
+
+    def sync_clients_to_toggl(self, sync, partners):
+        # Create or update the Toggl client of every partner,
+        # return partner id --> Toggl client id
+        client_ids = {}
+        for partner in partners:
+            client_ids[partner.id] = self.create_toggl_client(sync, {
+                'name': partner.name,
+                'toggl_id': sync.get_toggl_id(partner, 'toggl_partner_id'),
             })
+            # Update Toggl Client id to partner in Odoo
+            sync.set_toggl_id(partner, 'toggl_partner_id', client_ids[partner.id])
+        return client_ids
 
-    def sync_tasks_to_toggl(self, time_from=False):
+    def sync_tasks_to_toggl(self, time_from=False, sync=None, project_ids=None, save=True):
         self.ensure_one()
-        self.toggl_api_init()
+        sync = sync or self.sync_context()
+        if sync.projects is None:
+            self.load_toggl_projects(sync)
 
         # Fetch task types from Odoo
         # In this API we only sync tasks and issues to Toggl
         # that are in a stage that is not folded by default in Odoo's Kanban view
         task_types = self.get_task_types()
 
-        # Sync tasks for all active projects on Toggl
-        for toggl_project in self.toggl_projects:
-            project = self.env['project.project'].search([
-                ('toggl_project_id', '=', toggl_project['id']),
-            ])
-
-            if not project:
-                logger.debug("Toggl: Project not found in Odoo: %s" % toggl_project['name'])
+        if time_from:
+            # Delta run, only projects with tasks touched since the last run
+            touched = self.touched_task_project_ids(time_from, task_types)
+            project_ids = touched if project_ids is None else set(project_ids) & set(touched)
+
+        if project_ids is not None:
+            # Only tasks of these projects, e.g. one chunk of a sync job
+            projects = OrderedDict()
+            for project in self.env['project.project'].search([
+                    ('id', 'in', list(project_ids)),
+                    ('toggl_project_id', '!=', 0),
+                    ]):
+                if project.toggl_project_id in sync.projects:
+                    projects.setdefault(project.toggl_project_id, project)
+        else:
+            # Odoo projects of all Toggl projects
+            projects = self.find_projects([p['id'] for p in sync.projects])
+
+            for toggl_project in sync.projects:
+                if toggl_project['id'] not in projects:
+                    logger.debug("Toggl: Project not found in Odoo: %s" % toggl_project['name'])
+
+        # Fecth Project tasks from Toggl in parallel and put them in the sync context,
+        # tasks already loaded from the snapshot are not fetched again
+        missing = [pid for pid in projects if pid not in sync.tasks]
+        for toggl_pid, toggl_tasks in self.fetch_project_tasks(missing).items():
+            sync.tasks[toggl_pid] = TogglIndex(toggl_tasks, TogglTask)
+
+        # Sync tasks for all active projects on Toggl,
+        # fetch the tasks of all of them from Odoo in one query
+        taskdomain = [
+            ('project_id', 'in', [project.id for project in projects.values()]),
+            ('stage_id', 'in', task_types),
+        ]
+        if time_from:
+            # Only sync tasks that are touched since the last run
+            taskdomain.append(('write_date', '>=', time_from))
+
+        tasks_params = []
+        for task in self.env['project.task'].search(taskdomain) if projects else []:
+            tasks_params.append((task, {
+                'name': task.name,
+                'pid': task.project_id.toggl_project_id,
+                'id': task.id,
+                'toggl_id': task.toggl_task_id,
+            }))
+
+        # Create Toggl Tasks from Odoo tasks, independent tasks concurrently
+        calls = [self.toggl_task_call(sync, params) for task, params in tasks_params]
+        self.count_toggl_calls(sync, calls)
+
+        failures = []
+        for (task, params), result in zip(tasks_params, self.reconcile_toggl_objects(calls)):
+            if isinstance(result, TogglApiError):
+                failures.append((task, result))
                 continue
-
-            # Fecth Project tasks from Toggl and put them in class variable
-            toggl_tasks = self.project_tasks(project.toggl_project_id)
-            self.toggl_tasks[toggl_project['id']] = toggl_tasks
-
-            # Fetch tasks from Odoo
-            taskdomain = [
-                ('project_id', '=', project.id),
-                ('stage_id', 'in', task_types),
-            ]
-            if time_from:
-                 # Only sync tasks that are touched since the last run
-                taskdomain.append(('write_date', '>=', time_from))
-
-            tasks = self.env['project.task'].search(taskdomain)
-
-            for task in tasks:
-                # Create Toggl Task from Odoo task
-                toggl_tid = self.create_toggl_task({
-                    'name': task.name,
-                    'pid': project.toggl_project_id,
-                    'id': task.id,
-                    'toggl_id': task.toggl_task_id,
-                })
-                # Update Toggl Task id to task in Odoo
-                # .sudo() because we are only touching the toggl_task_id-field...
-                task.sudo().write({
-                    'toggl_task_id': toggl_tid,
-                })
-
-    def archive_completed_projects_tasks(self):
+            if isinstance(result, dict):
+                sync.tasks[params['pid']].add(result)
+                result = result['id']
+
+            # Update Toggl Task id to task in Odoo
+            sync.set_toggl_id(task, 'toggl_task_id', result)
+
+        self.flush_toggl_ids(sync)
+        if save:
+            self.save_snapshot(sync)
+        self.log_toggl_failures(sync, failures)
+        return sync
+
+    def touched_task_project_ids(self, time_from, task_types):
+        # Odoo projects linked to Toggl with tasks touched since time_from,
+        # in one grouped query
+        groups = self.env['project.task'].read_group([
+            ('write_date', '>=', time_from),
+            ('stage_id', 'in', task_types),
+            ('project_id.toggl_project_id', '!=', 0),
+        ], ['project_id'], ['project_id'])
+        return [group['project_id'][0] for group in groups if group['project_id']]
+
+    def flush_toggl_ids(self, sync):
+        # Write the Toggl ids queued during the run back to Odoo, one
+        # UPDATE ... FROM (VALUES ...) per model and chunk of records.
+        # Raw SQL on purpose: we are only touching the Toggl id fields, and
+        # leaving write_date alone keeps these records out of the next delta run.
+        for (model, field), toggl_ids in sync.toggl_ids.items():
+            Model = self.env[model]
+            for chunk in split_every(1000, list(toggl_ids.items())):
+                query = """
+                    UPDATE "{table}" SET "{field}" = v.toggl_id
+                    FROM (VALUES {values}) AS v(id, toggl_id)
+                    WHERE "{table}".id = v.id
+                """.format(
+                    table=Model._table,
+                    field=field,
+                    values=', '.join(['(%s, %s)'] * len(chunk)),
+                )
+                self.env.cr.execute(query, [value for row in chunk for value in row])
+            Model.invalidate_cache([field], list(toggl_ids))
+            logger.debug("Toggl: Updated %s %s of %s" % (len(toggl_ids), field, model))
+            sync.stats['toggl_ids'] += len(toggl_ids)
+        sync.toggl_ids.clear()
+
+    def archive_completed_projects_tasks(self, sync=None):
         # Deactivate Toggl projects that are not active in Odoo anymore
         self.ensure_one()
         self.toggl_api_init()
+        sync = sync or self.sync_context()
 
         # Active task types
         task_types = self.get_task_types()
 
         # Fetch all active projects from Toggl
-        toggl_projects = self.projects(self.toggl_workspace_id, 'true')
+        with sync.timer.phase('fetch'):
+            toggl_projects = self.projects(self.toggl_workspace_id, 'true') or []
+        projects = self.find_projects([p['id'] for p in toggl_projects])
 
         for toggl_project in toggl_projects:
-            project = self.env['project.project'].search([
-                ('toggl_project_id', '=', toggl_project['id'])
-            ], limit=1)
-
             # Project not active in Odoo anymore, arcive it in Toggl too
             # When project is archived it's tasks are also archived
-            if not project:
+            if toggl_project['id'] not in projects:
                 logger.warning("Toggl: Deactivate project: %s" % toggl_project['name'])
-                self.update_project(toggl_project['id'], {
-                    'active': False,
-                })
-                continue
+                with sync.timer.phase('archive'):
+                    self.update_project(toggl_project['id'], {
+                        'active': False,
+                    })
+                sync.stats['archived'] += 1
+
+        # Fetch tasks of the remaining projects in parallel
+        with sync.timer.phase('fetch'):
+            project_tasks = self.fetch_project_tasks(list(projects))
+        toggl_tasks = {
+            toggl_task['id']: toggl_task
+            for tasks in project_tasks.values() for toggl_task in tasks or []
+            if toggl_task.get('active', True)
+        }
 
-            # Fetch project's tasks
-            toggl_tasks = self.project_tasks(project.toggl_project_id)
-            if not toggl_tasks:
-                continue
+        # Toggl tasks of tasks still active in Odoo, in one query per chunk
+        live_task_ids = set()
+        for chunk in split_every(5000, list(toggl_tasks)):
+            live_task_ids.update(task['toggl_task_id'] for task in self.env['project.task'].search_read([
+                ('toggl_task_id', 'in', list(chunk)),
+                ('stage_id', 'in', task_types),
+            ], ['toggl_task_id']))
 
-            for toggl_task in toggl_tasks:
-                # Task not active in Odoo anymore, archive it in Toggl too
-                task = self.env['project.task'].search([
-                    ('toggl_task_id', '=', toggl_task['id']),
-                    ('stage_id', 'in', task_types),
-                ])
+        # Tasks not active in Odoo anymore, archive them in Toggl too
+        stale_task_ids = [tid for tid in toggl_tasks if tid not in live_task_ids]
+        for tid in stale_task_ids:
+            logger.warning("Toggl: Deactivate task: %s" % toggl_tasks[tid]['name'])
 
-                if not task:
-                    logger.warning("Toggl: Deactivate task: %s" % toggl_task['name'])
-                    self.update_task(toggl_task['id'], {
-                        'active': False,
-                    })
+        with sync.timer.phase('archive'):
+            for chunk in split_every(TOGGL_BULK_SIZE, stale_task_ids):
+                self.update_tasks(list(chunk), {
+                    'active': False,
+                })
+        sync.stats['archived'] += len(stale_task_ids)
+        return sync
+
+    def find_projects(self, toggl_project_ids):
+        # Return Odoo projects of the given Toggl projects, keyed by Toggl project id
+        projects = OrderedDict()
+        if not toggl_project_ids:
+            return projects
+        found = self.env['project.project'].search([
+            ('toggl_project_id', 'in', toggl_project_ids),
+        ])
+        by_toggl_id = {}
+        for project in found:
+            by_toggl_id.setdefault(project.toggl_project_id, project)
+        for toggl_project_id in toggl_project_ids:
+            if toggl_project_id in by_toggl_id:
+                projects[toggl_project_id] = by_toggl_id[toggl_project_id]
+        return projects
+
+    def fetch_project_tasks(self, toggl_project_ids):
+        # Fetch the tasks of many Toggl projects in parallel.
+        # Only HTTP requests run in the worker threads, all ORM work stays on
+        # the caller's cursor. The API client's rate limit is shared by the workers.
+        client = self.toggl_api()
+        urls = [self.project_tasks_url(pid) for pid in toggl_project_ids]
+        workers = max(min(self.toggl_max_parallel, self.toggl_pool_size or 10, len(urls)), 1)
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(client.bound(
+                    lambda url: project_records(client.request('get', url), TogglTask)), urls))
+        except TogglApiError as e:
+            raise Warning(str(e))
+        return OrderedDict(zip(toggl_project_ids, results))
 
     def get_task_types(self):
         # Return active task types (i.e. not filded in kanban view)
         return self.env['project.task.type'].search([('fold', '=', False)]).mapped('id')
 
-    def create_toggl_project(self, params):
+    def create_toggl_project(self, sync, params):
+        # Create or update the Toggl project, return its Toggl id
+        call = self.toggl_project_call(sync, params)
+        if not isinstance(call, tuple):
+            return call
+        response = getattr(self, call[0])(*call[1])
+        sync.projects.add(response)
+        return response['id']
+
+    def toggl_project_call(self, sync, params):
+        # Return the Toggl id of an up to date project,
+        # or the (endpoint, args) call that creates or updates it
+
         # Project name, including info about if it's a taks or a project and its Odoo id
         project_name = "%s [%s]" % (params['name'], params['id'])
 
         # Check if this project already exists in Toggl
-        toggl_project = next(filter(lambda p: p['id']==params['toggl_id'], self.toggl_projects), None)
+        toggl_project = sync.projects.get(params['toggl_id'])
 
         if not toggl_project:
             logger.debug("Toggl: Create project: %s" % project_name)
             # Create Toggl project
-            response = self.create_project({
+            return ('create_project', ({
                 'name': project_name,
                 'wid': self.toggl_workspace_id,
                 'is_private': False,
                 'cid': params['client_id'],
-            })
-            self.toggl_projects.append(response)
-            return response['id']
+            },))
         elif (project_name != toggl_project['name'] or
                 (toggl_project.get('cid', 0) != params['client_id']) or
                 (not toggl_project['active'])):
             logger.debug("Toggl: Update project: %s" % project_name)
-            response = self.update_project(toggl_project['id'], {
+            return ('update_project', (toggl_project['id'], {
                 'active': True,
                 'name': project_name,
                 'cid': params['client_id'],
-            })
-            return response['id']
+            }))
         else:
             return toggl_project['id']
 
-    def create_toggl_task(self, params):
+    def create_toggl_task(self, sync, params):
+        # Create or update the Toggl task, return its Toggl id
+        call = self.toggl_task_call(sync, params)
+        if not isinstance(call, tuple):
+            return call
+        response = getattr(self, call[0])(*call[1])
+        sync.tasks[params['pid']].add(response)
+        return response['id']
+
+    def toggl_task_call(self, sync, params):
+        # Return the Toggl id of an up to date task,
+        # or the (endpoint, args) call that creates or updates it
+
         # Task name, including info about if it's a taks or a project and its Odoo id
         task_name = "%s [%s]" % (params['name'], params['id'])
 
         # All Toggl tasks associated to this task's project
-        toggl_tasks = self.toggl_tasks[params['pid']]
-        toggl_task = None
+        toggl_tasks = sync.tasks[params['pid']]
 
         # Check if this task already exists in Toggl
-        if toggl_tasks:
-            toggl_task = next(filter(lambda t: t['id']==params['toggl_id'], toggl_tasks), None)
+        toggl_task = toggl_tasks.get(params['toggl_id'])
 
         if not toggl_task:
             logger.debug("Toggl: Create task: %s" % task_name)
@@ -425,22 +1459,66 @@ class TogglConnector(models.Model):
             }
 
             # Create Toggl task
-            response = self.create_task(task)
-            return response['id']
+            return ('create_task', (task,))
         elif (task_name != toggl_task['name'] or
                 (not toggl_task['active'])):
             logger.debug("Toggl: Update task: %s" % task_name)
-            response = self.update_task(toggl_task['id'], {
+            return ('update_task', (toggl_task['id'], {
                 'active': True,
                 'name': task_name,
-            })
-            return response['id']
+            }))
         else:
             return toggl_task['id']
 
-    def create_toggl_client(self, params):
+    def count_toggl_calls(self, sync, calls):
+        # Count objects created, updated and already up to date in Toggl
+        for call in calls:
+            if not isinstance(call, tuple):
+                sync.stats['unchanged'] += 1
+            elif call[0].startswith('create_'):
+                sync.stats['created'] += 1
+            else:
+                sync.stats['updated'] += 1
+
+    def reconcile_toggl_objects(self, calls):
+        # Resolve a list of Toggl ids / (endpoint, args) calls as returned by
+        # toggl_*_call() to Toggl objects. Calls are independent of each other,
+        # so they are sent concurrently. Returns Toggl id, response or the
+        # TogglApiError of a failed call, per call.
+        pending = [i for i, call in enumerate(calls) if isinstance(call, tuple)]
+        if not pending:
+            return list(calls)
+
+        async def send():
+            async with AsyncTogglApi(self.toggl_api(), self.toggl_max_parallel,
+                                     self.api_url(), self.reports_url()) as api:
+                return await asyncio.gather(*[
+                    getattr(api, calls[i][0])(*calls[i][1]) for i in pending
+                ], return_exceptions=True)
+
+        try:
+            responses = run_async(send())
+        except TogglApiError as e:
+            raise Warning(str(e))
+
+        results = list(calls)
+        for i, response in zip(pending, responses):
+            if isinstance(response, Exception) and not isinstance(response, TogglApiError):
+                raise response
+            results[i] = response
+        return results
+
+    def log_toggl_failures(self, sync, failures):
+        # Calls that failed while the others went through. The ids of the
+        # others are already written back, the failed records are synced
+        # again when touched or by the next full sync.
+        for record, error in failures:
+            logger.warning("Toggl: Sync of %s failed: %s" % (record.display_name, error))
+        sync.stats['errors'] += len(failures)
+
+    def create_toggl_client(self, sync, params):
         # Check if client exists in Toggl
-        toggl_client = next(filter(lambda c: c['id']==params['toggl_id'], self.toggl_clients), None)
+        toggl_client = sync.clients.get(params['toggl_id'])
 
         if not toggl_client:
             logger.debug("Toggl: Create client: %s" % params['name'])
@@ -448,109 +1526,139 @@ class TogglConnector(models.Model):
                 'name': params['name'],
                 'wid': self.toggl_workspace_id,
             })
-            self.toggl_clients.append(response)
+            sync.clients.add(response)
+            sync.stats['created'] += 1
             return response['id']
         elif params['name'] != toggl_client['name']:
             logger.debug("Toggl: Update client: %s" % params['name'])
             response = self.update_client(toggl_client['id'], {
                 'name': params['name'],
             })
+            sync.clients.add(response)
+            sync.stats['updated'] += 1
             return response['id']
         else:
+            sync.stats['unchanged'] += 1
             return toggl_client['id']
 
     def toggl_api_init(self):
         # Initilaize Toggl API
-        self.set_authorization_header(self.toggl_api_token)
+        return self.toggl_api()
 
-    def set_authorization_header(self, apitoken):
-        # Set authorization header
-        auth = apitoken + ':' + 'api_token'
-        auth = 'Basic ' + b64encode(auth.encode()).decode('ascii').rstrip()
-        self.headers['Authorization'] = auth
+    def toggl_api(self):
+        # Pooled API client of this connector, one per process
+        self.ensure_one()
+        return get_client(
+            (self.env.cr.dbname, self.id),
+            api_token=self.toggl_api_token,
+            pool_size=self.toggl_pool_size or 10,
+            keep_alive=self.toggl_keep_alive,
+            connect_timeout=self.toggl_connect_timeout or None,
+            read_timeout=self.toggl_read_timeout or None,
+            rate_limit=self.toggl_rate_limit,
+            max_retries=max(self.toggl_max_retries, 0),
+        )
+
+    def flush_api_stats(self):
+        # Add request counters of the API client to the connector
+        for toggl in self:
+            stats = toggl.toggl_api().pop_stats()
+            if not any(stats.values()):
+                continue
+            # .sudo() because we are only touching the counter fields...
+            toggl.sudo().write({
+                'api_requests_sent': toggl.api_requests_sent + stats['sent'],
+                'api_requests_throttled': toggl.api_requests_throttled + stats['throttled'],
+                'api_requests_retried': toggl.api_requests_retried + stats['retried'],
+            })
 
-    def do_request(self, method, url, params={}, data={}):
+    def do_request(self, method, url, params=None, data=None):
         # Do HTTP request to Toggl API
-        if method not in ['get','post','put']:
-            raise Warning('Unsupported HTTP method: %s' % (method))
-
-        if method=="get" and not 'user_agent' in params:
-            params['user_agent'] = 'Odoo_TogglAPI'
-
-        if method!="get":
-            if not 'user_agent' in data:
-                data['user_agent'] = 'Odoo_TogglAPI'
-            data = json.dumps(data).encode("utf-8")
-
-        # Init API request
-        r = requests
-        action = getattr(r, method)
-
         try:
-            res = action(url, headers=self.headers, params=params, data=data)
+            return self.toggl_api().request(method, url, params=params, data=data)
+        except TogglApiError as e:
+            raise Warning(str(e))
 
-        except requests.exceptions.RequestException as e:
-            raise Warning("There was an error in your get request: %s" % (e))
+    def api_url(self):
+        # Base URL of the Toggl API. The toggl_connector.api_url system parameter
+        # points all connectors to another server, e.g. the benchmark's fake Toggl.
+        return self.env['ir.config_parameter'].sudo().get_param('toggl_connector.api_url', API_URL)
 
-        if res.status_code != requests.codes.ok:
-           raise Warning("API returned error: %s, %s" % (res, res.text))
-
-        try:
-            response = json.loads(res.text)
-        except ValueError:
-            raise Warning("Decoding JSON response has failed: % s" % res.text)
-        return response
+    def reports_url(self):
+        return self.env['ir.config_parameter'].sudo().get_param('toggl_connector.reports_url', REPORTS_URL)
 
     """
     Functions for calling Toggl Api endpoints:
     """
     def me(self):
-        return self.do_request('get', 'https://www.toggl.com/api/v8/me')
+        return self.do_request('get', '%s/me' % self.api_url())
+
+    def me_changes(self, since):
+        # Clients, projects and tasks changed since the given unix time
+        return self.do_request('get', '%s/me' % self.api_url(), params={
+            'with_related_data': 'true',
+            'since': since,
+        })
 
     def users(self, wid):
-        return self.do_request('get', 'https://www.toggl.com/api/v8/workspaces/%s/workspace_users' % wid)
+        return self.do_request('get', '%s/workspaces/%s/workspace_users' % (self.api_url(), wid))
 
     def clients(self, wid):
-        return self.do_request('get', 'https://www.toggl.com/api/v8/workspaces/%s/clients' % wid)
+        return project_records(self.do_request(
+            'get', '%s/workspaces/%s/clients' % (self.api_url(), wid)), TogglClient)
 
     def projects(self, wid, active):
-        return self.do_request('get', 'https://www.toggl.com/api/v8/workspaces/%s/projects?active=%s' % (wid, active))
+        return project_records(self.do_request(
+            'get', '%s/workspaces/%s/projects?active=%s' % (self.api_url(), wid, active)), TogglProject)
 
     def project(self, project_id):
-        return self.do_request('get', 'https://www.toggl.com/api/v8/projects/%s' % project_id)
+        return self.do_request('get', '%s/projects/%s' % (self.api_url(), project_id))
 
     def project_tasks(self, project_id):
-        return self.do_request('get', 'https://www.toggl.com/api/v8//projects/%s/tasks' % project_id)
+        return project_records(self.do_request('get', self.project_tasks_url(project_id)), TogglTask)
+
+    def project_tasks_url(self, project_id):
+        return '%s/projects/%s/tasks' % (self.api_url(), project_id)
 
     def detailed_report(self, params):
-        return self.do_request('get', 'https://toggl.com/reports/api/v2/details/', params=params)
+        return self.do_request('get', self.detailed_report_url(), params=params)
+
+    def detailed_report_url(self):
+        return '%s/details/' % self.reports_url()
 
     def create_client(self, params):
         params = {'client': params}
-        response = self.do_request('post', 'https://www.toggl.com/api/v8/clients', data=params)
+        response = self.do_request('post', '%s/clients' % self.api_url(), data=params)
         return response['data']
 
     def update_client(self, client_id, params):
         params = {'client': params}
-        response = self.do_request('put', 'https://www.toggl.com/api/v8/clients/%s' % client_id, data=params)
+        response = self.do_request('put', '%s/clients/%s' % (self.api_url(), client_id), data=params)
         return response['data']
 
     def create_project(self, params):
         params = {'project': params}
-        response = self.do_request('post', 'https://www.toggl.com/api/v8/projects', data=params)
+        response = self.do_request('post', '%s/projects' % self.api_url(), data=params)
         return response['data']
 
     def update_project(self, project_id, params):
         params = {'project': params}
-        response = self.do_request('put', 'https://www.toggl.com/api/v8/projects/%s' % project_id, data=params)
+        response = self.do_request('put', '%s/projects/%s' % (self.api_url(), project_id), data=params)
         return response['data']
 
     def create_task(self, params):
         params = {'task': params}
-        response = self.do_request('post', 'https://www.toggl.com/api/v8/tasks', data=params)
+        response = self.do_request('post', '%s/tasks' % self.api_url(), data=params)
         return response['data']
 
     def update_task(self, task_id, params):
         params = {'task': params}
-        response = self.do_request('put', 'https://www.toggl.com/api/v8/tasks/%s' % task_id, data=params)
+        response = self.do_request('put', '%s/tasks/%s' % (self.api_url(), task_id), data=params)
+        return response['data']
+
+    def update_tasks(self, task_ids, params):
+        # Update many tasks with one request
+        params = {'task': params}
+        ids = ','.join(str(task_id) for task_id in task_ids)
+        response = self.do_request('put', '%s/tasks/%s' % (self.api_url(), ids), data=params)
         return response['data']
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+
+import json
+from datetime import timedelta
+
+from odoo import models, fields, api
+
+from .toggl_sync import TogglClient, TogglIndex, TogglProject, TogglRecord, TogglTask
+
+import logging
+logger = logging.getLogger(__name__)
+
+class TogglSnapshot(models.Model):
+    _name = "toggl.snapshot"
+    _description = "Toggl Workspace Snapshot"
+
+    _sql_constraints = [('toggl_snapshot_connector_uniq',
+                         'unique(connector_id)',
+                         'Only one Toggl snapshot per connector is allowed')]
+
+    connector_id = fields.Many2one('toggl.connector',
+        string='Connector',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    fetched_at = fields.Datetime('Fetched',
+        help="Time of the last full fetch of the workspace"
+    )
+    since = fields.Integer('Toggl since',
+        help="Toggl server time (unix) the snapshot is up to date with"
+    )
+    clients = fields.Text('Clients')
+    projects = fields.Text('Projects')
+    tasks = fields.Text('Tasks')
+
+    def is_fresh(self, ttl_hours):
+        # A snapshot is used until it is older than ttl_hours
+        if not self or not ttl_hours or not self.fetched_at:
+            return False
+        expires = fields.Datetime.from_string(self.fetched_at) + timedelta(hours=ttl_hours)
+        return expires > fields.Datetime.from_string(fields.Datetime.now())
+
+    def load(self, sync):
+        # Put the stored Toggl objects into the sync context
+        self.ensure_one()
+        sync.clients = TogglIndex(json.loads(self.clients or '[]'), TogglClient)
+        sync.projects = TogglIndex(json.loads(self.projects or '[]'), TogglProject)
+        sync.tasks = {
+            int(pid): TogglIndex(tasks, TogglTask)
+            for pid, tasks in json.loads(self.tasks or '{}').items()
+        }
+        sync.since = self.since
+
+    @api.model
+    def store(self, connector, sync, full=False):
+        # Save the Toggl objects of the sync context as the connector's snapshot
+        values = {
+            'since': sync.since,
+            'clients': json.dumps(list(sync.clients or []), default=TogglRecord.to_dict),
+            'projects': json.dumps(list(sync.projects or []), default=TogglRecord.to_dict),
+            'tasks': json.dumps({
+                pid: list(tasks) for pid, tasks in sync.tasks.items()
+            }, default=TogglRecord.to_dict),
+        }
+        if full:
+            values['fetched_at'] = fields.Datetime.now()
+
+        snapshot = self.search([('connector_id', '=', connector.id)])
+        if snapshot:
+            snapshot.write(values)
+        else:
+            values['connector_id'] = connector.id
+            snapshot = self.create(values)
+        return snapshot
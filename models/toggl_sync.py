@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+
+import hashlib
+import hmac
+import json
+import time
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+
+from dateutil import parser, tz
+
+
+class PhaseTimer(object):
+    """ Accumulates wall time spent in named phases of a sync run """
+
+    def __init__(self):
+        self.timings = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.time() - start
+
+    def __str__(self):
+        return ', '.join('%s: %.2fs' % (name, secs) for name, secs in self.timings.items())
+
+
+def toggl_local_date(value, timezone=None):
+    """ Day of a Toggl timestamp in the named timezone (UTC if none)
+
+    Report entries carry the offset of the report's user and webhook entries
+    are in UTC, converting both to one timezone books them on the same day.
+    """
+    value = parser.parse(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=tz.tzutc())
+    return value.astimezone(timezone and tz.gettz(timezone) or tz.tzutc()).strftime('%Y-%m-%d')
+
+
+def timesheet_fingerprint(timesheet):
+    """ Hash of the timesheet line values resolved from a Toggl time entry
+
+    Covers the Odoo side too (task, project and account the entry maps to),
+    so lines are rewritten when either Toggl data or the mapping changes.
+    """
+    payload = sorted((field, value) for field, value in timesheet.items()
+                     if field != 'toggl_fingerprint')
+    return hashlib.sha1(json.dumps(payload).encode('utf-8')).hexdigest()
+
+
+def verify_webhook_signature(secret, body, signature):
+    """ Check the X-Webhook-Signature-256 header of a Toggl webhook request """
+    if not secret or not signature or not signature.startswith('sha256='):
+        return False
+    digest = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(digest, signature[len('sha256='):])
+
+
+def webhook_time_entry(payload):
+    """ Time entry of a Toggl webhook event in the shape of a detailed report entry """
+    return {
+        'id': payload['id'],
+        'uid': payload.get('user_id'),
+        'pid': payload.get('project_id'),
+        'tid': payload.get('task_id'),
+        'description': payload.get('description'),
+        'project': '',
+        'start': payload.get('start'),
+        'dur': (payload.get('duration') or 0) * 1000,
+        'updated': payload.get('at'),
+    }
+
+
+class TogglRecord(object):
+    """ Toggl object reduced to the fields the sync uses
+
+    Kept in __slots__ instead of a dict, so big workspaces and reports take
+    a fraction of the memory. Reads like the decoded dict it replaces:
+    record['name'], record.get('cid', 0), and fields Toggl did not send
+    are missing rather than None.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, values):
+        record = cls.__new__(cls)
+        for field in cls.__slots__:
+            if field in values:
+                setattr(record, field, values[field])
+        return record
+
+    def __getitem__(self, field):
+        if field in self.__slots__ and hasattr(self, field):
+            return getattr(self, field)
+        raise KeyError(field)
+
+    def __setitem__(self, field, value):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        setattr(self, field, value)
+
+    def __contains__(self, field):
+        return field in self.__slots__ and hasattr(self, field)
+
+    def get(self, field, default=None):
+        if field in self.__slots__:
+            return getattr(self, field, default)
+        return default
+
+    def keys(self):
+        return [field for field in self.__slots__ if hasattr(self, field)]
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.keys()}
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.to_dict())
+
+
+class TogglClient(TogglRecord):
+    __slots__ = ('id', 'name', 'wid', 'server_deleted_at')
+
+
+class TogglProject(TogglRecord):
+    __slots__ = ('id', 'name', 'active', 'cid', 'wid', 'server_deleted_at')
+
+
+class TogglTask(TogglRecord):
+    __slots__ = ('id', 'name', 'active', 'pid', 'wid', 'server_deleted_at')
+
+
+class TogglTimeEntry(TogglRecord):
+    __slots__ = ('id', 'uid', 'description', 'dur', 'start', 'tid', 'pid', 'project', 'updated')
+
+
+def project_records(records, record_type):
+    """ Decoded Toggl objects (a list or None) as record_type records """
+    return [record_type.from_dict(values) for values in records or []]
+
+
+class TogglIndex(object):
+    """ Toggl objects (clients, projects or tasks) indexed by id
+
+    Objects are added or replaced in place when they are created or updated
+    in Toggl, so lookups during a sync run stay constant time. With a
+    record_type, decoded objects added are reduced to it.
+    """
+
+    def __init__(self, records=None, record_type=None):
+        self.by_id = OrderedDict()
+        self.record_type = record_type
+        for record in records or []:
+            self.add(record)
+
+    def add(self, record):
+        # Insert a new object or replace an existing one with the same id,
+        # e.g. the response of a create or update call
+        if self.record_type is not None and isinstance(record, dict):
+            record = self.record_type.from_dict(record)
+        self.by_id[record['id']] = record
+        return record
+
+    def discard(self, toggl_id):
+        # Remove an object, e.g. one deleted in Toggl
+        self.by_id.pop(toggl_id, None)
+
+    def get(self, toggl_id, default=None):
+        if not toggl_id:
+            return default
+        return self.by_id.get(toggl_id, default)
+
+    def __contains__(self, toggl_id):
+        return toggl_id in self.by_id
+
+    def __iter__(self):
+        return iter(self.by_id.values())
+
+    def __len__(self):
+        return len(self.by_id)
+
+
+class SyncContext(object):
+    """ State of one sync run of one connector
+
+    Holds the connector's API client (and so its auth), the Toggl objects
+    fetched during the run and the run's statistics. A new context is made
+    for every run, nothing is shared between runs, threads or companies.
+    """
+
+    def __init__(self, api, workspace_id):
+        self.api = api
+        self.workspace_id = workspace_id
+
+        # Toggl clients and projects of the workspace,
+        # None until fetched during this run
+        self.clients = None
+        self.projects = None
+
+        # Toggl tasks of each project, keyed by Toggl project id
+        self.tasks = {}
+
+        # Toggl server time (unix) the fetched objects are up to date with
+        self.since = None
+
+        # Toggl ids to write back to Odoo records at the end of the run,
+        # (model, field) --> {record id: Toggl id}
+        self.toggl_ids = defaultdict(dict)
+
+        # Ids of all Toggl time entries seen in the report
+        self.entry_ids = set()
+
+        self.timer = PhaseTimer()
+        self.stats = Counter()
+
+        # Messages kept on the run's history, e.g. records given up on
+        self.notes = []
+
+    def get_toggl_id(self, record, field):
+        # Toggl id of an Odoo record, including a write-back pending in this run
+        return self.toggl_ids[(record._name, field)].get(record.id, record[field])
+
+    def set_toggl_id(self, record, field, toggl_id):
+        # Queue a Toggl id write-back, unless the record already has that id
+        if self.get_toggl_id(record, field) != toggl_id:
+            self.toggl_ids[(record._name, field)][record.id] = toggl_id
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+
+import json
+
+from odoo import models, fields, api
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Runs a chunk may fail before it is skipped
+TOGGL_CHUNK_MAX_ATTEMPTS = 3
+
+class TogglSyncJob(models.Model):
+    _name = "toggl.sync.job"
+    _description = "Toggl Sync Job"
+
+    _sql_constraints = [('toggl_sync_job_connector_uniq',
+                         'unique(connector_id)',
+                         'Only one Toggl sync job per connector is allowed')]
+
+    connector_id = fields.Many2one('toggl.connector',
+        string='Connector',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    state = fields.Selection([
+        ('running', 'Running'),
+        ('done', 'Done'),
+    ], string='State', default='done', required=True)
+    stage = fields.Selection([
+        ('projects', 'Projects'),
+        ('tasks', 'Tasks'),
+    ], string='Stage')
+    time_from = fields.Datetime('Changes since',
+        help="Records touched since this time are synced, empty for a full sync"
+    )
+    time_to = fields.Datetime('Started',
+        help="Start of the run, becomes the connector's latest run when all chunks are done"
+    )
+    todo_ids = fields.Text('Remaining records',
+        help="Ids of the Odoo projects still to sync in the current stage"
+    )
+    chunks_done = fields.Integer('Chunks done')
+    chunk_attempts = fields.Integer('Chunk attempts',
+        help="Runs that started the current chunk without finishing it"
+    )
+    skipped_ids = fields.Text('Skipped records',
+        help="""Ids of the Odoo projects of chunks skipped after failing too many
+            times. The latest run is not moved while there are any, so the
+            next run syncs them again."""
+    )
+
+    @api.model
+    def get_job(self, connector):
+        job = self.search([('connector_id', '=', connector.id)])
+        if not job:
+            job = self.create({'connector_id': connector.id})
+        return job
+
+    def start(self, time_from, time_to, project_ids):
+        self.ensure_one()
+        self.write({
+            'state': 'running',
+            'stage': 'projects',
+            'time_from': time_from,
+            'time_to': time_to,
+            'todo_ids': json.dumps(project_ids),
+            'chunks_done': 0,
+            'chunk_attempts': 0,
+            'skipped_ids': False,
+        })
+
+    def next_chunk(self, size):
+        # Ids of the next chunk of the current stage, empty when the stage is done
+        self.ensure_one()
+        return json.loads(self.todo_ids or '[]')[:size]
+
+    def chunk_started(self):
+        # Count the attempt before syncing, so a chunk that keeps
+        # failing or killing the run is noticed on the next runs
+        self.ensure_one()
+        self.chunk_attempts += 1
+
+    def chunk_failing(self):
+        self.ensure_one()
+        return self.chunk_attempts >= TOGGL_CHUNK_MAX_ATTEMPTS
+
+    def chunk_done(self, chunk):
+        # Checkpoint: drop a synced chunk from the remaining ids
+        self.ensure_one()
+        done = set(chunk)
+        self.write({
+            'todo_ids': json.dumps([i for i in json.loads(self.todo_ids or '[]') if i not in done]),
+            'chunks_done': self.chunks_done + 1,
+            'chunk_attempts': 0,
+        })
+
+    def skip_chunk(self, chunk):
+        # Give up on a chunk that failed too many times and move on
+        self.ensure_one()
+        logger.error("Toggl: Skipped %s chunk after %s failed attempts: %s" % (
+            self.stage, self.chunk_attempts, chunk))
+        self.skipped_ids = json.dumps(json.loads(self.skipped_ids or '[]') + list(chunk))
+        self.chunk_done(chunk)
+
+    def next_stage(self, stage, project_ids):
+        self.ensure_one()
+        self.write({
+            'stage': stage,
+            'todo_ids': json.dumps(project_ids),
+        })
+
+    def finish(self):
+        self.ensure_one()
+        self.write({
+            'state': 'done',
+            'stage': False,
+            'todo_ids': False,
+        })
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+
+from odoo import models, fields, api
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile of a list of numbers
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class TogglSyncRun(models.Model):
+    _name = "toggl.sync.run"
+    _description = "Toggl Sync Run"
+    _order = "start desc, id desc"
+
+    connector_id = fields.Many2one('toggl.connector',
+        string='Connector',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    kind = fields.Selection([
+        ('sync', 'Sync Projects and Tasks'),
+        ('archive', 'Archive Projects and Tasks'),
+        ('import', 'Import Time Entries'),
+        ('workspace_import', 'Import Workspace Time Entries'),
+        ('backfill', 'Backfill Time Entries'),
+    ], string='Run', required=True, index=True)
+    user_id = fields.Many2one('res.users', 'User')
+    state = fields.Selection([
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], string='State', default='done', required=True)
+    start = fields.Datetime('Start', index=True)
+    duration = fields.Float('Duration (s)', group_operator='avg')
+    phase_timings = fields.Text('Phase timings')
+    http_requests = fields.Integer('HTTP requests')
+    http_latency_p50 = fields.Float('HTTP latency p50 (ms)', group_operator='avg')
+    http_latency_p95 = fields.Float('HTTP latency p95 (ms)', group_operator='avg')
+    http_latency_max = fields.Float('HTTP latency max (ms)', group_operator='max')
+    sql_queries = fields.Integer('SQL queries')
+    created = fields.Integer('Created')
+    updated = fields.Integer('Updated')
+    unchanged = fields.Integer('Unchanged')
+    skipped = fields.Integer('Skipped')
+    deleted = fields.Integer('Deleted / Archived')
+    errors = fields.Integer('Errors')
+    error = fields.Text('Error')
+    notes = fields.Text('Notes')
+
+    @api.model
+    def run_values(self, connector, kind, sync, start, duration, latencies, sql_queries, error=None):
+        latencies = [seconds * 1000.0 for seconds in latencies]
+        return {
+            'connector_id': connector.id,
+            'kind': kind,
+            'user_id': self.env.uid,
+            'state': 'failed' if error else 'done',
+            'start': start,
+            'duration': duration,
+            'phase_timings': str(sync.timer),
+            'http_requests': len(latencies),
+            'http_latency_p50': percentile(latencies, 50),
+            'http_latency_p95': percentile(latencies, 95),
+            'http_latency_max': max(latencies) if latencies else 0.0,
+            'sql_queries': sql_queries,
+            'created': sync.stats['created'],
+            'updated': sync.stats['updated'],
+            'unchanged': sync.stats['unchanged'],
+            'skipped': sync.stats['skipped'],
+            'deleted': sync.stats['deleted'] + sync.stats['archived'],
+            'errors': sync.stats['errors'] + (1 if error else 0),
+            'error': error or False,
+            'notes': '\n'.join(sync.notes) or False,
+        }
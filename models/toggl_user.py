@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+
+from collections import defaultdict
+
+from odoo import models, fields, api
+
+import logging
+logger = logging.getLogger(__name__)
+
+class TogglUser(models.Model):
+    _name = "toggl.user"
+    _description = "Toggl Workspace User"
+    _order = "connector_id, email"
+
+    _sql_constraints = [('toggl_user_uid_uniq',
+                         'unique(connector_id, toggl_uid)',
+                         'Toggl user is already mapped for this connector')]
+
+    connector_id = fields.Many2one('toggl.connector',
+        string='Connector',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    toggl_uid = fields.Integer('Toggl User Id', required=True, index=True)
+    email = fields.Char('Email', index=True)
+    user_id = fields.Many2one('res.users', 'User', index=True, ondelete='set null')
+    employee_id = fields.Many2one('hr.employee', 'Employee', ondelete='set null')
+
+    @api.model
+    def refresh_users(self, connector):
+        # Fetch the workspace users of the connector from Toggl once
+        # and store them, linked to Odoo users and employees
+        toggl_users = {
+            toggl_user['uid']: (toggl_user.get('email') or '').strip().lower()
+            for toggl_user in connector.users(connector.toggl_workspace_id) or []
+        }
+        rows = self.search([('connector_id', '=', connector.id)])
+
+        # Users removed from the workspace
+        rows.filtered(lambda row: row.toggl_uid not in toggl_users).unlink()
+
+        existing = {row.toggl_uid: row for row in rows.exists()}
+        for uid, email in toggl_users.items():
+            row = existing.get(uid)
+            if not row:
+                existing[uid] = self.create({
+                    'connector_id': connector.id,
+                    'toggl_uid': uid,
+                    'email': email,
+                })
+            elif row.email != email:
+                row.email = email
+
+        mapping = self.browse([row.id for row in existing.values()])
+        mapping.link_users()
+        logger.debug("Toggl: Refreshed %s workspace users" % len(mapping))
+        return mapping
+
+    @api.multi
+    def link_users(self):
+        # Match the Toggl users to Odoo users by Toggl username (email),
+        # and to the users' employees when they have exactly one
+        emails = [email for email in self.mapped('email') if email]
+        users = {}
+        for user in self.env['res.users'].search_read(
+                [('toggl_username', '!=', False)], ['toggl_username']):
+            users.setdefault(user['toggl_username'].strip().lower(), user['id'])
+
+        user_employees = defaultdict(list)
+        user_ids = [users[email] for email in emails if email in users]
+        for employee in self.env['hr.employee'].search_read(
+                [('user_id', 'in', user_ids)], ['user_id']):
+            user_employees[employee['user_id'][0]].append(employee['id'])
+
+        for row in self:
+            user_id = users.get(row.email) or False
+            employee_ids = user_employees.get(user_id, [])
+            if user_id and len(employee_ids) != 1:
+                logger.warning("Toggl: User %s must be linked to exactly one Employee" % row.email)
+            employee_id = employee_ids[0] if len(employee_ids) == 1 else False
+            if row.user_id.id != user_id or row.employee_id.id != employee_id:
+                row.write({
+                    'user_id': user_id,
+                    'employee_id': employee_id,
+                })
+
+    @api.model
+    def relink_users(self, users):
+        # Update the rows of changed Odoo users, and rows that match their new username
+        emails = [user.toggl_username.strip().lower() for user in users if user.toggl_username]
+        self.search(['|', ('user_id', 'in', users.ids), ('email', 'in', emails)]).link_users()
+
+    @api.model
+    def employee_map(self, connector):
+        # Return Toggl user id --> Odoo employee id of the connector's linked
+        # users, fetching the workspace users on first use
+        domain = [('connector_id', '=', connector.id)]
+        if not self.search_count(domain):
+            self.refresh_users(connector)
+        return {
+            row['toggl_uid']: row['employee_id'][0]
+            for row in self.search_read(domain + [('employee_id', '!=', False)],
+                                        ['toggl_uid', 'employee_id'])
+        }
+
+    @api.model
+    def find_user(self, connector, user):
+        # Mapping row of an Odoo user, refreshed from Toggl once when missing
+        domain = [('connector_id', '=', connector.id), ('user_id', '=', user.id)]
+        row = self.search(domain, limit=1)
+        if not row:
+            self.refresh_users(connector)
+            row = self.search(domain, limit=1)
+        return row
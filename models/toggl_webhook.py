@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+
+import json
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+
+from odoo import models, fields, api
+
+from .toggl_sync import webhook_time_entry
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Failed events are retried this many times, with exponential backoff
+WEBHOOK_MAX_ATTEMPTS = 5
+
+class TogglWebhookEvent(models.Model):
+    _name = "toggl.webhook.event"
+    _description = "Toggl Webhook Event"
+    _order = "id"
+
+    _sql_constraints = [('toggl_webhook_event_uniq',
+                         'unique(connector_id, event_id)',
+                         'Toggl webhook event already received')]
+
+    connector_id = fields.Many2one('toggl.connector',
+        string='Connector',
+        required=True,
+        index=True,
+        ondelete='cascade'
+    )
+    event_id = fields.Char('Toggl Event Id', index=True)
+    entity = fields.Char('Entity', help="Toggl model of the event, e.g. time_entry")
+    action = fields.Char('Action', help="created, updated or deleted")
+    entity_id = fields.Integer('Toggl Id')
+    payload = fields.Text('Payload')
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('retry', 'Retry'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], string='State', default='pending', required=True, index=True)
+    attempts = fields.Integer('Attempts', readonly=True)
+    next_attempt = fields.Datetime('Next attempt', readonly=True)
+    error = fields.Text('Error')
+
+    @api.model
+    def queue_event(self, connector, event):
+        # Store a received webhook event, duplicates are ignored
+        event_id = str(event.get('event_id') or '')
+        if event_id and self.search_count([
+                ('connector_id', '=', connector.id),
+                ('event_id', '=', event_id)]):
+            return self.browse()
+
+        metadata = event.get('metadata') or {}
+        payload = event.get('payload') or {}
+        return self.create({
+            'connector_id': connector.id,
+            'event_id': event_id or False,
+            'entity': metadata.get('model'),
+            'action': metadata.get('action'),
+            'entity_id': isinstance(payload, dict) and payload.get('id') or 0,
+            'payload': json.dumps(payload),
+        })
+
+    @api.model
+    def process_events_cron(self, limit=500):
+        # Apply pending events, and failed ones due for a retry,
+        # in small batches per connector
+        events = self.search([
+            '|',
+            ('state', '=', 'pending'),
+            '&',
+            ('state', '=', 'retry'),
+            ('next_attempt', '<=', fields.Datetime.now()),
+        ], limit=limit)
+        by_connector = defaultdict(lambda: self.browse())
+        for event in events:
+            by_connector[event.connector_id] |= event
+
+        for connector, connector_events in by_connector.items():
+            connector_events.apply_events(connector)
+            connector.commit_progress()
+
+    @api.multi
+    def requeue_events(self):
+        # Apply failed events again on the next cron run
+        self.write({
+            'state': 'pending',
+            'attempts': 0,
+            'next_attempt': False,
+            'error': False,
+        })
+
+    def apply_events(self, connector):
+        # Apply the events of one connector to Odoo, the whole batch at once
+        # when possible. If the batch fails, the events of every Toggl object
+        # are applied on their own, so a bad event only holds back its object.
+        try:
+            with self.env.cr.savepoint():
+                self.apply_event_batch(connector)
+        except Exception as e:
+            logger.warning("Toggl: Applying webhook events failed, applying them one by one! %s" % (e))
+            self.invalidate_cache()
+        else:
+            self.write({'state': 'done', 'error': False})
+            return True
+
+        by_object = OrderedDict()
+        for event in self:
+            key = (event.entity, event.entity_id)
+            by_object[key] = by_object.get(key, self.browse()) | event
+
+        for events in by_object.values():
+            try:
+                with self.env.cr.savepoint():
+                    events.apply_event_batch(connector)
+            except Exception as e:
+                logger.warning("Toggl: Applying webhook events %s failed! %s" % (events.ids, e))
+                self.invalidate_cache()
+                events.schedule_retry(str(e))
+            else:
+                events.write({'state': 'done', 'error': False})
+        return False
+
+    def schedule_retry(self, error):
+        # Retry failed events with exponential backoff, give up after WEBHOOK_MAX_ATTEMPTS
+        now = fields.Datetime.from_string(fields.Datetime.now())
+        for event in self:
+            attempts = event.attempts + 1
+            if attempts >= WEBHOOK_MAX_ATTEMPTS:
+                event.write({'state': 'failed', 'attempts': attempts, 'error': error})
+            else:
+                event.write({
+                    'state': 'retry',
+                    'attempts': attempts,
+                    'next_attempt': fields.Datetime.to_string(now + timedelta(minutes=2 ** attempts)),
+                    'error': error,
+                })
+
+    def apply_event_batch(self, connector):
+        # Apply the events to Odoo. Created and updated Toggl projects and
+        # tasks need nothing here: the next sync fetches them from Toggl.
+        time_entries = {}
+        deleted_entries = set()
+        deleted_ids = {'project': set(), 'task': set()}
+
+        # Only the latest event of each object matters
+        for event in self:
+            if event.entity == 'time_entry':
+                if event.action == 'deleted':
+                    time_entries.pop(event.entity_id, None)
+                    deleted_entries.add(event.entity_id)
+                else:
+                    payload = json.loads(event.payload or '{}')
+                    # Running entries are imported once they are stopped
+                    if (payload.get('duration') or 0) >= 0:
+                        time_entries[event.entity_id] = webhook_time_entry(payload)
+                    deleted_entries.discard(event.entity_id)
+            elif event.entity in deleted_ids and event.action == 'deleted':
+                deleted_ids[event.entity].add(event.entity_id)
+
+        if time_entries:
+            sync = connector.sync_context()
+            connector.import_time_entries_page(
+                sync, list(time_entries.values()), connector.get_toggl_employees(), True)
+
+        if deleted_entries:
+            self.env['account.analytic.line'].search([
+                ('toggl_entry_id', 'in', list(deleted_entries)),
+            ]).unlink()
+
+        # Objects deleted in Toggl are recreated by the next sync. The ids are
+        # cleared with write() on purpose, the new write_date brings the
+        # records into the next delta run. Tasks of a deleted project are
+        # gone in Toggl as well.
+        projects = self.env['project.project'].with_context(active_test=False).search([
+            ('toggl_project_id', 'in', list(deleted_ids['project']))])
+        if projects:
+            projects.write({'toggl_project_id': 0})
+        tasks = self.env['project.task'].with_context(active_test=False).search([
+            '|', ('toggl_task_id', 'in', list(deleted_ids['task'])),
+            '&', ('project_id', 'in', projects.ids), ('toggl_task_id', '!=', 0)])
+        if tasks:
+            tasks.write({'toggl_task_id': 0})
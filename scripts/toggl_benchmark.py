@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+"""
+Benchmark the Toggl connector against a simulated Toggl workspace.
+
+A fake Toggl API server is started in a separate process and the connector
+is pointed to it with the toggl_connector.api_url and
+toggl_connector.reports_url system parameters. For every scale a synthetic
+workspace is generated (clients, projects, tasks per project, users and time
+entries per user), the matching Odoo partners, projects, tasks, users and
+employees are created and the sync steps are run against it:
+
+    sync_projects_to_toggl, sync_tasks_to_toggl (first and repeated run)
+    archive_completed_projects_tasks
+    sync_time_entries_from_toggl (first and repeated run)
+    sync_workspace_time_entries_from_toggl
+
+Each step reports the HTTP requests received by the fake server, the SQL
+queries of the Odoo cursor, wall time and peak Python memory. Everything is
+rolled back at the end of each scale, but use a throwaway database anyway:
+
+    python3 toggl_benchmark.py -c odoo.conf -d benchdb --scales small,medium \\
+        --output results.json
+
+    # Fail when requests or queries grew by more than 10 %
+    python3 toggl_benchmark.py -c odoo.conf -d benchdb --baseline results.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import re
+import socketserver
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.request
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+SCALES = {
+    'small': {
+        'clients': 5, 'projects': 10, 'tasks_per_project': 5,
+        'users': 2, 'entries_per_user': 100,
+    },
+    'medium': {
+        'clients': 20, 'projects': 100, 'tasks_per_project': 10,
+        'users': 5, 'entries_per_user': 1000,
+    },
+    'large': {
+        'clients': 100, 'projects': 500, 'tasks_per_project': 20,
+        'users': 20, 'entries_per_user': 5000,
+    },
+}
+
+WORKSPACE_ID = 1
+REPORT_PER_PAGE = 50
+REPORT_DAYS = 30
+
+
+class FakeToggl(object):
+    """ In-memory Toggl workspace behind the fake API server """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset({'users': 0, 'entries_per_user': 0})
+
+    def reset(self, spec):
+        self.spec = spec
+        self.next_id = 1
+        self.clients = {}
+        self.projects = {}
+        self.tasks = {}
+        self.users = [{
+            'id': 1000 + i,
+            'uid': 1000 + i,
+            'wid': WORKSPACE_ID,
+            'email': 'toggl.bench.%s@example.com' % i,
+        } for i in range(spec['users'])]
+        self.entries = None
+        self.requests = Counter()
+
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    def save(self, store, values, object_id=None):
+        record = dict(store.get(object_id) or {'wid': WORKSPACE_ID, 'active': True})
+        record.update(values)
+        record['id'] = object_id or self.new_id()
+        record['at'] = time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime())
+        store[record['id']] = record
+        return record
+
+    def time_entries(self):
+        # Generated on first use from the tasks synced so far, so that
+        # the entries point to real Toggl tasks and projects
+        if self.entries is None:
+            tasks = sorted(self.tasks.values(), key=lambda t: t['id'])
+            today = date.today()
+            self.entries = []
+            for user in self.users:
+                for i in range(self.spec['entries_per_user']):
+                    task = tasks[i % len(tasks)] if tasks else None
+                    day = today - timedelta(days=i % REPORT_DAYS)
+                    self.entries.append({
+                        'id': self.new_id(),
+                        'uid': user['uid'],
+                        'description': 'Benchmark entry %s' % i,
+                        'start': '%sT09:00:00+00:00' % day.isoformat(),
+                        'dur': (15 + i % 120) * 60 * 1000,
+                        # Every fifth entry is booked on the project only
+                        'tid': task['id'] if task and i % 5 else None,
+                        'pid': task['pid'] if task else None,
+                        'project': self.projects[task['pid']]['name'] if task else '',
+                        'updated': '%sT17:00:00+00:00' % day.isoformat(),
+                    })
+        return self.entries
+
+    def details(self, query):
+        uids = {int(uid) for uid in query.get('user_ids', '').split(',') if uid}
+        since, until = query.get('since', ''), query.get('until', '9999')
+        entries = [te for te in self.time_entries()
+                   if te['uid'] in uids and since <= te['start'][:10] <= until]
+        page = int(query.get('page', 1))
+        return {
+            'total_count': len(entries),
+            'per_page': REPORT_PER_PAGE,
+            'data': entries[(page - 1) * REPORT_PER_PAGE:page * REPORT_PER_PAGE],
+        }
+
+    def handle(self, method, path, query, body):
+        # Return the endpoint name and response of one API call
+        parts = [p for p in path.split('/') if p]
+        if parts[:2] == ['reports', 'api']:
+            return 'GET details', self.details(query)
+        parts = parts[2:]  # Strip api/v8
+        if parts == ['me']:
+            if 'since' in query:
+                # Nothing changes behind the connector's back
+                return 'GET me changes', {'since': int(time.time()), 'data': {}}
+            return 'GET me', {'data': {'id': 1, 'default_wid': WORKSPACE_ID}}
+        if parts[0] == 'workspaces':
+            kind = parts[2]
+            if kind == 'workspace_users':
+                return 'GET workspace_users', self.users
+            if kind == 'clients':
+                return 'GET clients', list(self.clients.values()) or None
+            active = query.get('active', 'true')
+            projects = [p for p in self.projects.values()
+                        if active == 'both' or p['active'] == (active == 'true')]
+            return 'GET projects', projects or None
+
+        kind = parts[0]
+        store = getattr(self, kind)
+        data = (body or {}).get(kind[:-1], {})
+        if len(parts) == 1:
+            return 'POST %s' % kind, {'data': self.save(store, data)}
+        if len(parts) == 3:
+            tasks = [t for t in self.tasks.values() if t['pid'] == int(parts[1])]
+            return 'GET project tasks', tasks or None
+        ids = [int(i) for i in parts[1].split(',')]
+        if method == 'GET':
+            return 'GET %s/:id' % kind, {'data': store.get(ids[0])}
+        records = [self.save(store, data, i) for i in ids]
+        name = 'PUT %s/:ids' % kind if len(ids) > 1 else 'PUT %s/:id' % kind
+        return name, {'data': records if len(ids) > 1 else records[0]}
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(toggl):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, payload, status=200):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def dispatch(self, method):
+            url = urlsplit(self.path)
+            path = re.sub('/+', '/', url.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length).decode('utf-8')) if length else None
+
+            with toggl.lock:
+                if path == '/_bench/reset':
+                    toggl.reset(body)
+                    return self.reply({})
+                if path == '/_bench/stats':
+                    stats, toggl.requests = toggl.requests, Counter()
+                    return self.reply(stats)
+                try:
+                    endpoint, payload = toggl.handle(method, path, query, body)
+                except (KeyError, IndexError, ValueError, AttributeError) as e:
+                    toggl.requests['%s %s (error)' % (method, path)] += 1
+                    return self.reply({'error': str(e)}, status=404)
+                toggl.requests[endpoint] += 1
+            self.reply(payload)
+
+        def do_GET(self):
+            self.dispatch('GET')
+
+        def do_POST(self):
+            self.dispatch('POST')
+
+        def do_PUT(self):
+            self.dispatch('PUT')
+
+    return Handler
+
+
+def serve(port, ready):
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(FakeToggl()))
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def control(url, path, payload=None):
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    req = urllib.request.Request(url + path, data=data, method='POST' if data else 'GET')
+    with urllib.request.urlopen(req) as res:
+        return json.loads(res.read().decode('utf-8'))
+
+
+def setup_odoo(env, url, spec):
+    # Create the Odoo side of the synthetic workspace and a connector for it
+    env['ir.config_parameter'].set_param('toggl_connector.api_url', url + '/api/v8')
+    env['ir.config_parameter'].set_param('toggl_connector.reports_url', url + '/reports/api/v2')
+
+    stage = env['project.task.type'].create({'name': 'Benchmark', 'fold': False})
+    done = env['project.task.type'].create({'name': 'Benchmark done', 'fold': True})
+    partners = [env['res.partner'].create({'name': 'Benchmark client %s' % i})
+                for i in range(spec['clients'])]
+    projects = env['project.project']
+    for i in range(spec['projects']):
+        projects |= env['project.project'].create({
+            'name': 'Benchmark project %s' % i,
+            'partner_id': partners[i % len(partners)].id if partners else False,
+            'type_ids': [(6, 0, [stage.id, done.id])],
+        })
+    for project in projects:
+        for i in range(spec['tasks_per_project']):
+            env['project.task'].create({
+                'name': 'Benchmark task %s' % i,
+                'project_id': project.id,
+                'stage_id': stage.id,
+            })
+
+    # The first Toggl user is the benchmark's own user, the wizard imports as it
+    users = env.user
+    for i in range(1, spec['users']):
+        users |= env['res.users'].create({
+            'name': 'Toggl Benchmark %s' % i,
+            'login': 'toggl.bench.%s' % i,
+        })
+    for i, user in enumerate(users):
+        user.toggl_username = 'toggl.bench.%s@example.com' % i
+        if not env['hr.employee'].search([('user_id', '=', user.id)]):
+            env['hr.employee'].create({'name': user.name, 'user_id': user.id})
+
+    default_project = env['project.project'].create({'name': 'Benchmark default'})
+    values = {
+        'name': 'Toggl Benchmark',
+        'toggl_api_token': 'benchmark',
+        'toggl_workspace_id': WORKSPACE_ID,
+        'toggl_default_project': default_project.id,
+        'toggl_rate_limit': 0,
+        'toggl_snapshot_ttl': 0,
+    }
+    toggl = env['toggl.connector'].search([('company_id', '=', env.user.company_id.id)])
+    if toggl:
+        toggl.write(values)
+    else:
+        toggl = env['toggl.connector'].create(values)
+    return toggl, projects, done
+
+
+def measure(env, url, step, function):
+    # Run one step and collect its cost
+    control(url, '/_bench/stats')
+    queries = env.cr.sql_log_count
+    tracemalloc.start()
+    start = time.time()
+    function()
+    wall = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    requests = control(url, '/_bench/stats')
+    return {
+        'step': step,
+        'requests': sum(requests.values()),
+        'endpoints': requests,
+        'sql_queries': env.cr.sql_log_count - queries,
+        'wall_time': round(wall, 3),
+        'peak_memory_kb': peak // 1024,
+    }
+
+
+def run_scale(env, url, scale, spec):
+    control(url, '/_bench/reset', spec)
+    toggl, projects, done = setup_odoo(env, url, spec)
+    date_to = fields_date(date.today())
+    date_from = fields_date(date.today() - timedelta(days=REPORT_DAYS))
+
+    def sync_all():
+        sync = toggl.sync_projects_to_toggl()
+        toggl.sync_tasks_to_toggl(sync=sync)
+
+    def finish_tasks():
+        # Every tenth task is done, and archived in Toggl by the next step
+        tasks = env['project.task'].search([('project_id', 'in', projects.ids)])
+        tasks.filtered(lambda t: t.id % 10 == 0).write({'stage_id': done.id})
+
+    results = []
+    for step, function in [
+            ('sync_projects_to_toggl', lambda: toggl.sync_projects_to_toggl()),
+            ('sync_tasks_to_toggl', lambda: toggl.sync_tasks_to_toggl()),
+            ('sync (unchanged)', sync_all),
+            ('archive_completed_projects_tasks', lambda: (
+                finish_tasks(), toggl.archive_completed_projects_tasks())),
+            ('sync_time_entries_from_toggl', lambda: toggl.sync_time_entries_from_toggl(
+                date_from, date_to, True, commit=False)),
+            ('sync_time_entries_from_toggl (unchanged)', lambda: toggl.sync_time_entries_from_toggl(
+                date_from, date_to, True, commit=False)),
+            ('sync_workspace_time_entries_from_toggl', lambda: (
+                toggl.sync_workspace_time_entries_from_toggl(date_from, date_to, True, commit=False))),
+            ]:
+        result = measure(env, url, step, function)
+        result['scale'] = scale
+        results.append(result)
+        print("%-8s %-42s %7s req %8s sql %9.2fs %9s KB" % (
+            scale, step, result['requests'], result['sql_queries'],
+            result['wall_time'], result['peak_memory_kb']))
+        sys.stdout.flush()
+    return results
+
+
+def fields_date(value):
+    return value.strftime('%Y-%m-%d')
+
+
+def compare(results, baseline, tolerance, time_tolerance):
+    # Return the steps that got more expensive than in the baseline
+    previous = {(r['scale'], r['step']): r for r in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get((result['scale'], result['step']))
+        if not old:
+            continue
+        for key, allowed in [('requests', tolerance), ('sql_queries', tolerance),
+                             ('wall_time', time_tolerance)]:
+            if result[key] > old[key] * (1 + allowed) and result[key] - old[key] > 1:
+                regressions.append("%s %s: %s %s -> %s" % (
+                    result['scale'], result['step'], key, old[key], result[key]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Toggl connector")
+    parser.add_argument('-c', '--config', help="Odoo configuration file")
+    parser.add_argument('-d', '--database', required=True, help="Throwaway Odoo database")
+    parser.add_argument('--addons-path', help="Odoo addons path")
+    parser.add_argument('--scales', default='small',
+                        help="Comma separated scales: %s" % ', '.join(SCALES))
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--baseline', help="Compare to the results in this JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="Allowed growth of requests and SQL queries (default 10 %%)")
+    parser.add_argument('--time-tolerance', type=float, default=0.5,
+                        help="Allowed growth of wall time (default 50 %%)")
+    args = parser.parse_args(argv)
+
+    import odoo
+    options = ['-d', args.database]
+    if args.config:
+        options += ['-c', args.config]
+    if args.addons_path:
+        options += ['--addons-path', args.addons_path]
+    odoo.tools.config.parse_config(options)
+
+    # The fake Toggl runs in its own process, so it is not measured with the connector
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(0, ready), daemon=True)
+    server.start()
+    url = 'http://127.0.0.1:%s' % ready.get(timeout=10)
+
+    # Keep the connector from committing, everything is rolled back per scale
+    threading.currentThread().testing = True
+
+    results = []
+    try:
+        with odoo.api.Environment.manage():
+            registry = odoo.registry(args.database)
+            for scale in args.scales.split(','):
+                with registry.cursor() as cr:
+                    env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+                    try:
+                        results += run_scale(env, url, scale, SCALES[scale])
+                    finally:
+                        cr.rollback()
+    finally:
+        server.terminate()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.time_tolerance)
+        for regression in regressions:
+            print("REGRESSION %s" % regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+"""
+Replay recorded Toggl webhook events against an Odoo instance.
+
+Events are read from a JSON file holding a list of events (or one event per
+line), signed with the connector's webhook secret like Toggl does and posted
+one by one to the connector's webhook endpoint:
+
+    python3 toggl_webhook_replay.py events.json \\
+        --url http://localhost:8069/toggl/webhook/1?db=mydb --secret s3cret
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import sys
+import urllib.error
+import urllib.request
+
+
+def load_events(path):
+    with open(path) as f:
+        content = f.read().strip()
+    if content.startswith('['):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def sign(secret, body):
+    # X-Webhook-Signature-256 header value of a request body
+    return 'sha256=%s' % hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+def send(url, secret, body):
+    # Post a signed body, return the response status and content
+    req = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'X-Webhook-Signature-256': sign(secret, body),
+    })
+    try:
+        with urllib.request.urlopen(req) as res:
+            return res.status, res.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def post_event(url, secret, event):
+    return send(url, secret, json.dumps(event).encode('utf-8'))[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay Toggl webhook events")
+    parser.add_argument('events', help="JSON file with the events to replay")
+    parser.add_argument('--url', required=True, help="Webhook URL of the connector")
+    parser.add_argument('--secret', required=True, help="Webhook secret of the connector")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for event in load_events(args.events):
+        status = post_event(args.url, args.secret, event)
+        metadata = event.get('metadata') or {}
+        print("%s %s %s: %s" % (event.get('event_id'), metadata.get('model'),
+                                metadata.get('action'), status))
+        failed += status != 200
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+
+import json
+import threading
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import patch
+from urllib.parse import urlparse
+
+from odoo.tests import common
+
+from ..models import toggl_async
+from ..models.toggl_api import TogglApi, TogglApiError
+from ..models.toggl_async import AsyncTogglApi
+from ..models.toggl_sync import TogglClient, TogglIndex, TogglProject
+
+
+class StubToggl(object):
+    """ Canned replies of a local stub Toggl server, by method and path """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.replies = defaultdict(deque)
+        self.requests = []
+
+    def reply(self, method, path, *replies):
+        # (status, headers, payload) replies, the last one is repeated
+        self.replies[(method, path)].extend(replies)
+
+    def handle(self, method, path):
+        with self.lock:
+            self.requests.append((method, path))
+            replies = self.replies[(method, path)]
+            if not replies:
+                return 404, {}, {}
+            return replies.popleft() if len(replies) > 1 else replies[0]
+
+
+def make_handler(toggl):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, *args):
+            pass
+
+        def dispatch(self, method):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            status, headers, payload = toggl.handle(method, urlparse(self.path).path)
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self.dispatch('get')
+
+        def do_POST(self):
+            self.dispatch('post')
+
+        def do_PUT(self):
+            self.dispatch('put')
+
+    return Handler
+
+
+class StubTogglCase(common.TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(StubTogglCase, cls).setUpClass()
+        cls.toggl = StubToggl()
+        cls.server = HTTPServer(('127.0.0.1', 0), make_handler(cls.toggl))
+        cls.url = 'http://127.0.0.1:%s' % cls.server.server_address[1]
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super(StubTogglCase, cls).tearDownClass()
+
+    def setUp(self):
+        super(StubTogglCase, self).setUp()
+        self.reset()
+
+    def reset(self):
+        self.toggl.replies.clear()
+        del self.toggl.requests[:]
+
+    def requests_to(self, method, path):
+        return self.toggl.requests.count((method, path))
+
+
+class TestAsyncTogglApi(StubTogglCase):
+
+    def client(self):
+        return TogglApi('token', rate_limit=0, max_retries=2, backoff=0.0)
+
+    def modes(self):
+        # With aiohttp when installed, and with the blocking client in threads
+        if toggl_async.aiohttp is not None:
+            yield 'aiohttp'
+        with patch.object(toggl_async, 'aiohttp', None):
+            yield 'threads'
+
+    def call(self, client, method, *args):
+        async def send():
+            async with AsyncTogglApi(client, 4, self.url, self.url) as api:
+                return await getattr(api, method)(*args)
+        return toggl_async.run(send())
+
+    def test_throttled_requests_are_retried(self):
+        for mode in self.modes():
+            self.reset()
+            self.toggl.reply('get', '/projects/1',
+                             (429, {'Retry-After': '0'}, {}),
+                             (200, {}, {'data': {'id': 1, 'name': 'Project'}}))
+            client = self.client()
+            response = self.call(client, 'project', 1)
+
+            self.assertEqual(response['data']['id'], 1, mode)
+            self.assertEqual(self.requests_to('get', '/projects/1'), 2, mode)
+            self.assertEqual(client.stats['throttled'], 1, mode)
+            self.assertEqual(client.stats['retried'], 1, mode)
+
+    def test_server_errors_are_only_retried_for_idempotent_methods(self):
+        for mode in self.modes():
+            self.reset()
+            self.toggl.reply('get', '/projects/1/tasks',
+                             (503, {}, {}), (200, {}, [{'id': 2, 'name': 'Task'}]))
+            self.toggl.reply('post', '/projects', (503, {}, {}))
+            client = self.client()
+
+            self.assertEqual(self.call(client, 'project_tasks', 1), [{'id': 2, 'name': 'Task'}], mode)
+            with self.assertRaises(TogglApiError):
+                self.call(client, 'create_project', {'name': 'Project'})
+            self.assertEqual(self.requests_to('post', '/projects'), 1, mode)
+
+    def test_errors_are_raised_after_the_last_retry(self):
+        for mode in self.modes():
+            self.reset()
+            self.toggl.reply('get', '/projects/1', (503, {}, {}))
+            with self.assertRaises(TogglApiError):
+                self.call(self.client(), 'project', 1)
+            self.assertEqual(self.requests_to('get', '/projects/1'), 3, mode)
+
+
+class TestReconcileTogglObjects(StubTogglCase):
+
+    def setUp(self):
+        super(TestReconcileTogglObjects, self).setUp()
+        env = self.env
+        env['ir.config_parameter'].sudo().set_param('toggl_connector.api_url', self.url)
+        default_project = env['project.project'].create({'name': 'Toggl default'})
+        self.connector = env['toggl.connector'].search([('company_id', '=', env.user.company_id.id)])
+        values = {
+            'name': 'Toggl',
+            'toggl_api_token': 'token',
+            'toggl_workspace_id': 1,
+            'toggl_default_project': default_project.id,
+            'toggl_rate_limit': 0,
+            'toggl_max_retries': 1,
+        }
+        if self.connector:
+            self.connector.write(values)
+        else:
+            self.connector = env['toggl.connector'].create(values)
+        self.connector.toggl_api().backoff = 0.0
+
+    def test_failed_calls_are_returned(self):
+        self.toggl.reply('post', '/projects', (200, {}, {'data': {'id': 10, 'name': 'New', 'wid': 1}}))
+        self.toggl.reply('put', '/projects/5', (400, {}, {}))
+
+        results = self.connector.reconcile_toggl_objects([
+            3,
+            ('create_project', ({'name': 'New', 'wid': 1},)),
+            ('update_project', (5, {'name': 'Renamed'})),
+        ])
+
+        self.assertEqual(results[0], 3)
+        self.assertEqual(results[1]['id'], 10)
+        self.assertIsInstance(results[2], TogglApiError)
+
+    def test_successful_ids_are_kept_when_others_fail(self):
+        self.toggl.reply('post', '/projects',
+                         (200, {}, {'data': {'id': 10, 'name': 'New', 'wid': 1, 'billable': True}}),
+                         (500, {}, {}))
+        projects = self.env['project.project'].create({'name': 'First'}) | \
+            self.env['project.project'].create({'name': 'Second'})
+
+        sync = self.connector.sync_context()
+        sync.clients = TogglIndex([], TogglClient)
+        sync.projects = TogglIndex([], TogglProject)
+        self.connector.sync_projects_to_toggl(sync=sync, project_ids=projects.ids, save=False)
+
+        projects.invalidate_cache()
+        self.assertEqual(sorted(projects.mapped('toggl_project_id')), [0, 10])
+        self.assertEqual(sync.stats['errors'], 1)
+        # Responses are kept reduced to the fields the sync uses
+        self.assertIsInstance(sync.projects.get(10), TogglProject)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+
+from unittest.mock import patch
+
+from odoo.tests import common
+
+from ..models.toggl_connector import TOGGL_LOCK_KEY
+
+
+class TogglConnectorCase(object):
+
+    def setUp(self):
+        super(TogglConnectorCase, self).setUp()
+        env = self.env
+        default_project = env['project.project'].create({'name': 'Toggl default'})
+        self.connector = env['toggl.connector'].search([('company_id', '=', env.user.company_id.id)])
+        values = {
+            'name': 'Toggl',
+            'toggl_api_token': 'token',
+            'toggl_workspace_id': 1,
+            'toggl_default_project': default_project.id,
+        }
+        if self.connector:
+            self.connector.write(values)
+        else:
+            self.connector = env['toggl.connector'].create(values)
+
+    def lock_held(self):
+        self.env.cr.execute("""
+            SELECT count(*) FROM pg_locks
+            WHERE locktype = 'advisory' AND pid = pg_backend_pid()
+              AND classid = %s AND objid = %s
+        """, (TOGGL_LOCK_KEY, self.connector.id))
+        return bool(self.env.cr.fetchone()[0])
+
+
+class TestTogglConnectorLock(TogglConnectorCase, common.TransactionCase):
+
+    def test_lock_is_released_after_sql_error(self):
+        def failing_sync(connector, sync_all=False):
+            # E.g. a serialization failure in the middle of the job
+            connector.env.cr.execute("SELECT 1 / 0")
+
+        with patch.object(type(self.env['toggl.connector']), 'sync_to_toggl', failing_sync):
+            result = self.env['toggl.connector'].run_connector(
+                self.connector.id, 'sync_to_toggl', (False,))
+
+        self.assertEqual(result['state'], 'failed')
+        self.assertIn('division by zero', result['error'])
+        self.assertFalse(self.lock_held())
+
+        # The transaction is usable again and the next run gets the lock
+        self.assertTrue(self.connector.try_lock())
+        self.connector.unlock()
+        self.assertFalse(self.lock_held())
+
+    def test_lock_is_released_after_run(self):
+        with patch.object(type(self.env['toggl.connector']), 'sync_to_toggl', lambda connector, sync_all=False: None):
+            self.assertTrue(self.connector.run_locked('sync_to_toggl', False))
+        self.assertFalse(self.lock_held())
+
+
+class TestTogglSyncJob(TogglConnectorCase, common.TransactionCase):
+
+    def test_skipped_chunk_keeps_latest_run(self):
+        project = self.env['project.project'].create({'name': 'Failing project'})
+        self.connector.last_cron_run = '2020-01-01 00:00:00'
+        job = self.env['toggl.sync.job'].get_job(self.connector)
+        job.start('2020-01-01 00:00:00', '2020-02-01 00:00:00', [project.id])
+        job.chunk_attempts = 3
+
+        Connector = type(self.env['toggl.connector'])
+        sync = self.connector.sync_context()
+        with patch.object(Connector, 'load_toggl_projects', lambda *args, **kwargs: None), \
+                patch.object(Connector, 'touched_task_project_ids', lambda *args: []):
+            self.connector.run_sync_job(sync=sync)
+
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(self.connector.last_cron_run, '2020-01-01 00:00:00')
+        self.assertEqual(sync.stats['errors'], 1)
+        self.assertIn(str(project.id), sync.notes[0])
+
+
+class TestTogglBackfill(TogglConnectorCase, common.TransactionCase):
+
+    def test_new_dates_restart_the_backfill(self):
+        self.connector.write({
+            'backfill_date_from': '2020-01-01',
+            'backfill_date_to': '2020-12-31',
+            'backfill_done_until': '2020-12-31',
+        })
+        self.assertEqual(self.connector.backfill_done_until, '2020-12-31')
+        self.connector.backfill_date_from = '2019-01-01'
+        self.assertFalse(self.connector.backfill_done_until)
+
+    def test_bulk_insert_fills_in_like_create(self):
+        partner = self.env['res.partner'].create({'name': 'Toggl customer'})
+        project = self.env['project.project'].create({'name': 'Customer project', 'partner_id': partner.id})
+        employee = self.env['hr.employee'].create({'name': 'Toggl backfill employee'})
+        values = {
+            'name': 'Backfilled work',
+            'date': '2020-01-01',
+            'unit_amount': 1.0,
+            'account_id': project.analytic_account_id.id,
+            'project_id': project.id,
+            'task_id': False,
+            'employee_id': employee.id,
+            'toggl_entry_id': 1,
+            'toggl_fingerprint': 'fingerprint',
+        }
+        AnalyticLine = self.env['account.analytic.line']
+        inserted = AnalyticLine.browse(self.connector.bulk_insert_time_entries([values]))
+        created = AnalyticLine.create(dict(values, toggl_entry_id=2))
+
+        self.assertEqual(inserted.partner_id, partner)
+        for field in ('partner_id', 'product_uom_id', 'company_id', 'account_id', 'amount'):
+            self.assertEqual(inserted[field], created[field], field)
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    ODOO Addon module by Johan Tötterman
+#    Copyright (C) 2019 Johan Tötterman
+#
+##############################################################################
+
+import importlib.util
+import json
+import os
+
+import odoo
+from odoo.tests import common
+
+from ..models.toggl_sync import verify_webhook_signature, webhook_time_entry
+
+SECRET = 's3cret'
+TOGGL_UID = 5000
+
+
+def load_replay_script():
+    # scripts/ is not a package, load the replay tool from its file
+    path = os.path.join(os.path.dirname(__file__), '..', 'scripts', 'toggl_webhook_replay.py')
+    spec = importlib.util.spec_from_file_location('toggl_webhook_replay', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_entry_event(event_id, entry_id, start='2020-01-01T23:30:00+00:00', action='created'):
+    return {
+        'event_id': event_id,
+        'metadata': {'model': 'time_entry', 'action': action},
+        'payload': {
+            'id': entry_id,
+            'user_id': TOGGL_UID,
+            'project_id': 111,
+            'task_id': 222,
+            'description': 'Webhook work',
+            'start': start,
+            'duration': 3600,
+            'at': '2020-01-02T00:30:00+00:00',
+        },
+    }
+
+
+class TogglWebhookCase(object):
+
+    def setUp(self):
+        super(TogglWebhookCase, self).setUp()
+        env = self.env
+        default_project = env['project.project'].create({'name': 'Toggl default'})
+        self.project = env['project.project'].create({
+            'name': 'Toggl project',
+            'toggl_project_id': 111,
+        })
+        stage = env['project.task.type'].create({'name': 'Toggl open', 'fold': False})
+        self.task = env['project.task'].create({
+            'name': 'Toggl task',
+            'project_id': self.project.id,
+            'stage_id': stage.id,
+            'toggl_task_id': 222,
+        })
+
+        user = env['res.users'].create({
+            'name': 'Toggl Webhook User',
+            'login': 'toggl.webhook.user',
+            'toggl_username': 'webhook@example.com',
+            'tz': 'Europe/Helsinki',
+        })
+        self.employee = env['hr.employee'].create({'name': user.name, 'user_id': user.id})
+
+        self.connector = env['toggl.connector'].search([('company_id', '=', env.user.company_id.id)])
+        values = {
+            'name': 'Toggl',
+            'toggl_api_token': 'token',
+            'toggl_workspace_id': 1,
+            'toggl_default_project': default_project.id,
+            'toggl_webhook_secret': SECRET,
+        }
+        if self.connector:
+            self.connector.write(values)
+        else:
+            self.connector = env['toggl.connector'].create(values)
+
+        # Linked users are mapped up front, so no Toggl API call is made
+        env['toggl.user'].create({
+            'connector_id': self.connector.id,
+            'toggl_uid': TOGGL_UID,
+            'email': 'webhook@example.com',
+            'user_id': user.id,
+            'employee_id': self.employee.id,
+        })
+
+    def lines(self, entry_id):
+        return self.env['account.analytic.line'].search([('toggl_entry_id', '=', entry_id)])
+
+
+class TestTogglWebhook(TogglWebhookCase, common.TransactionCase):
+
+    def test_signature(self):
+        body = b'{"event_id": 1}'
+        signature = load_replay_script().sign(SECRET, body)
+        self.assertTrue(verify_webhook_signature(SECRET, body, signature))
+        self.assertFalse(verify_webhook_signature(SECRET, body + b' ', signature))
+        self.assertFalse(verify_webhook_signature('other', body, signature))
+        self.assertFalse(verify_webhook_signature(SECRET, body, None))
+
+    def test_webhook_and_report_book_the_same_day(self):
+        # 23:30 UTC is already the next day in Helsinki
+        webhook_entry = webhook_time_entry(time_entry_event('e1', 1001)['payload'])
+        report_entry = dict(webhook_entry, start='2020-01-02T01:30:00+02:00', dur=3600000)
+
+        connector = self.connector
+        employees = connector.get_toggl_employees()
+        tasks, projects, existing = connector.prefetch_time_entry_maps([webhook_entry])
+        timezones = connector.employee_timezones(employees.values())
+        from_webhook = connector.time_entry_timesheet(webhook_entry, employees, tasks, projects, timezones)
+        from_report = connector.time_entry_timesheet(report_entry, employees, tasks, projects, timezones)
+
+        self.assertEqual(from_webhook['date'], '2020-01-02')
+        self.assertEqual(from_webhook, from_report)
+
+    def test_duplicate_events_are_queued_once(self):
+        Event = self.env['toggl.webhook.event']
+        self.assertTrue(Event.queue_event(self.connector, time_entry_event('e1', 1001)))
+        self.assertFalse(Event.queue_event(self.connector, time_entry_event('e1', 1001)))
+
+    def test_apply_events(self):
+        Event = self.env['toggl.webhook.event']
+        Event.queue_event(self.connector, time_entry_event('e1', 1001))
+        Event.process_events_cron()
+
+        line = self.lines(1001)
+        self.assertEqual(len(line), 1)
+        self.assertEqual(line.task_id, self.task)
+        self.assertEqual(line.date, '2020-01-02')
+        self.assertEqual(line.unit_amount, 1.0)
+
+        Event.queue_event(self.connector, time_entry_event('e2', 1001, action='deleted'))
+        Event.process_events_cron()
+        self.assertFalse(self.lines(1001))
+
+    def test_deleted_project_is_cleared_for_the_next_sync(self):
+        Event = self.env['toggl.webhook.event']
+        Event.queue_event(self.connector, {
+            'event_id': 'p1',
+            'metadata': {'model': 'project', 'action': 'deleted'},
+            'payload': {'id': 111},
+        })
+        Event.process_events_cron()
+
+        self.assertEqual(self.project.toggl_project_id, 0)
+        self.assertEqual(self.task.toggl_task_id, 0)
+
+    def test_bad_event_only_holds_back_its_object(self):
+        Event = self.env['toggl.webhook.event']
+        good = Event.queue_event(self.connector, time_entry_event('e1', 1001))
+        bad = Event.queue_event(self.connector, time_entry_event('e2', 1002, start='not a date'))
+        Event.process_events_cron()
+
+        self.assertEqual(good.state, 'done')
+        self.assertTrue(self.lines(1001))
+        self.assertEqual(bad.state, 'retry')
+        self.assertEqual(bad.attempts, 1)
+        self.assertTrue(bad.next_attempt)
+        self.assertFalse(self.lines(1002))
+
+        # Retries are not due yet, then give up after the last attempt
+        Event.process_events_cron()
+        self.assertEqual(bad.attempts, 1)
+        bad.write({'attempts': 4, 'next_attempt': '2000-01-01 00:00:00'})
+        Event.process_events_cron()
+        self.assertEqual(bad.state, 'failed')
+
+        bad.requeue_events()
+        self.assertEqual(bad.state, 'pending')
+        self.assertEqual(bad.attempts, 0)
+
+
+@common.at_install(False)
+@common.post_install(True)
+class TestTogglWebhookReplay(TogglWebhookCase, common.HttpCase):
+
+    def webhook_url(self):
+        return 'http://%s:%s/toggl/webhook/%s?db=%s' % (
+            common.HOST, odoo.tools.config['http_port'], self.connector.id, self.env.cr.dbname)
+
+    def test_replayed_events_are_queued(self):
+        replay = load_replay_script()
+        events = [time_entry_event('e1', 1001), time_entry_event('e2', 1002)]
+        for event in events:
+            self.assertEqual(replay.post_event(self.webhook_url(), SECRET, event), 200)
+
+        queued = self.env['toggl.webhook.event'].search([('connector_id', '=', self.connector.id)])
+        self.assertEqual(sorted(queued.mapped('event_id')), ['e1', 'e2'])
+        self.assertEqual(set(queued.mapped('state')), {'pending'})
+
+    def test_bad_signature_is_rejected(self):
+        replay = load_replay_script()
+        status = replay.post_event(self.webhook_url(), 'wrong', time_entry_event('e1', 1001))
+        self.assertEqual(status, 403)
+        self.assertFalse(self.env['toggl.webhook.event'].search([('connector_id', '=', self.connector.id)]))
+
+    def test_validation_code_is_echoed(self):
+        replay = load_replay_script()
+        body = json.dumps({'validation_code': 'abc'}).encode('utf-8')
+        status, content = replay.send(self.webhook_url(), SECRET, body)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(content.decode('utf-8')), {'validation_code': 'abc'})
@@ -31,9 +31,13 @@ class TogglWizard(models.TransientModel):
 
     last_fetch = fields.Date('Last fetch', default=_default_last_fetch)
     update_existing = fields.Boolean('Update existing time entries', default=True)
+    recheck = fields.Boolean('Re-check recent entries',
+        help="""Import the entries of the connector's re-check window, updating
+            changed entries and removing entries deleted in Toggl. Edits older
+            than the window need an import of their dates.""")
 
-    date_from = fields.Date('Date From', default=_default_last_fetch, required=True)
-    date_to = fields.Date('Date To', default=lambda *a: time.strftime('%Y-%m-%d'), required=True)
+    date_from = fields.Date('Date From', default=_default_last_fetch)
+    date_to = fields.Date('Date To', default=lambda *a: time.strftime('%Y-%m-%d'))
 
     def import_time_entries(self):
         user = self.env['res.users'].browse(self.env.uid)
@@ -44,12 +48,19 @@ class TogglWizard(models.TransientModel):
         if not toggl:
             raise Warning("No Toggl Settings defined for your company")
 
-        synced_entries = toggl.sync_time_entries_from_toggl(self.date_from, self.date_to, self.update_existing)
+        if not self.recheck and not (self.date_from and self.date_to):
+            raise Warning("Please give the dates to import time entries for")
+
+        with toggl.record_run('import') as sync:
+            synced_entries = toggl.sync_time_entries_from_toggl(
+                self.date_from, self.date_to, self.update_existing,
+                recheck=self.recheck, sync=sync)
+        toggl.flush_api_stats()
 
         # Update toggl_last_fetch to user in Odoo
         # .sudo() because we are only touching the toggl_last_fetch-field...
         user.sudo().write({
-            'toggl_last_fetch': self.date_to,
+            'toggl_last_fetch': fields.Date.today() if self.recheck else self.date_to,
         })
 
         return {